@@ -1,18 +1,1779 @@
 import sys
 import os
-import csv
-import json
-import pickle
+import io
+import time
+import mmap
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import deque
+from itertools import chain, compress, groupby, islice, repeat, zip_longest
+from operator import itemgetter
+
+
+class LazyModule:
+    # Placeholder for a module-level import. The first attribute lookup imports the
+    # real module and rebinds the global name to it, so a run only pays for the modules
+    # (codecs above all) that it actually uses, and later lookups cost nothing extra.
+    def __init__(self, name, binding=None):
+        self.name = name
+        self.binding = binding or name
+
+    def __getattr__(self, attribute):
+        __import__(self.name)
+        module = sys.modules[self.name]
+        globals()[self.binding] = module
+        return getattr(module, attribute)
+
+
+re = LazyModule("re")
+heapq = LazyModule("heapq")
+locale = LazyModule("locale")
+random = LazyModule("random")
+tempfile = LazyModule("tempfile")
+csv = LazyModule("csv")
+json = LazyModule("json")
+pickle = LazyModule("pickle")
+gzip = LazyModule("gzip")
+bz2 = LazyModule("bz2")
+lzma = LazyModule("lzma")
+struct = LazyModule("struct")
+futures = LazyModule("concurrent.futures", "futures")
+queue = LazyModule("queue")
+contextlib = LazyModule("contextlib")
+copy = LazyModule("copy")
+fnmatch = LazyModule("fnmatch")
+socketserver = LazyModule("socketserver")
+stat = LazyModule("stat")
+threading = LazyModule("threading")
+
+def parse_options(args):
+    # Split "--name" / "--name=value" flags from the positional arguments
+    positional = []
+    options = {}
+    for arg in args:
+        if arg.startswith("--"):
+            name, _, value = arg[2:].partition("=")
+            options[name] = value if value else True
+        else:
+            positional.append(arg)
+    return positional, options
+
+
+# Row offset index kept next to the source file (source.csv.idx)
+INDEX_EVERY = 1000
+# Patterns stay plain bytes until used (re keeps the compiled ones cached)
+RECORD_MARKS = rb'["\n]'
+LINE_MARKS = rb'\n'  # JSON Lines: every newline ends a record, quotes or not
+
+
+def scan_record_offsets(path, every=INDEX_EVERY, marks=RECORD_MARKS):
+    # Byte offset of every Nth record; newlines inside quoted fields don't end a record
+    offsets = array('Q', [0])
+    rows = 0
+    position = 0
+    in_quotes = False
+    ends_clean = True
+    with open(path, 'rb') as file:
+        while True:
+            chunk = file.read(1 << 20)
+            if not chunk:
+                break
+            newlines = chunk.count(b"\n")
+            if not in_quotes and (marks == LINE_MARKS or b'"' not in chunk) and rows % every + newlines < every:
+                # Fast path: no quotes and no checkpoint inside this chunk
+                rows += newlines
+            else:
+                for match in re.finditer(marks, chunk):
+                    if match.group() == b'"':
+                        in_quotes = not in_quotes
+                    elif not in_quotes:
+                        rows += 1
+                        if rows % every == 0:
+                            offsets.append(position + match.end())
+            position += len(chunk)
+            ends_clean = not in_quotes and chunk.endswith(b"\n")
+        tail, blank_newlines = blank_tail(file, position) if marks == LINE_MARKS else (0, 0)
+
+    if tail:
+        # JSON Lines: blank lines after the last record are trailing whitespace, not rows
+        content_end = position - tail
+        rows = rows - blank_newlines + 1 if content_end else 0
+        return {"rows": rows, "every": every, "offsets": offsets[:max(1, bisect_left(offsets, content_end))]}
+    if not ends_clean:
+        rows += 1  # Last record has no trailing newline
+    elif len(offsets) > 1 and offsets[-1] == position:
+        offsets.pop()  # A checkpoint at the very end isn't the start of a record
+    return {"rows": rows, "every": every, "offsets": offsets}
+
+
+def blank_tail(file, size):
+    # Length of the whitespace at the end of a file, and the newlines in it
+    position = size
+    newlines = 0
+    while position > 0:
+        start = max(0, position - (1 << 16))
+        file.seek(start)
+        chunk = file.read(position - start)
+        kept = len(chunk.rstrip())
+        newlines += chunk.count(b"\n", kept)
+        if kept:
+            return size - start - kept, newlines
+        position = start
+    return size, newlines
+
+
+def iter_record_ends(file, start, marks=RECORD_MARKS):
+    # End offset of each record from byte `start` onwards (quote-aware unless `marks`
+    # only matches newlines)
+    file.seek(start)
+    position = start
+    last_end = start
+    in_quotes = False
+    while True:
+        chunk = file.read(1 << 16)
+        if not chunk:
+            break
+        for match in re.finditer(marks, chunk):
+            if match.group() == b'"':
+                in_quotes = not in_quotes
+            elif not in_quotes:
+                last_end = position + match.end()
+                yield last_end
+        position += len(chunk)
+    if position > last_end:
+        yield position
+
+
+def load_row_index(path, every=INDEX_EVERY, marks=RECORD_MARKS):
+    # Reuse the sidecar while the source keeps the size and mtime it was built for.
+    # A finer sidecar (say every row, for --lazy) also serves any coarser request.
+    index_path = path + ".idx"
+    stat = os.stat(path)
+    try:
+        with open(index_path, 'rb') as index_file:
+            index = pickle.load(index_file)
+        if (index["size"], index["mtime_ns"]) == (stat.st_size, stat.st_mtime_ns) and every % index["every"] == 0:
+            if index["every"] != every:
+                index["offsets"] = index["offsets"][::every // index["every"]]
+                index["every"] = every
+            return index
+    except (FileNotFoundError, EOFError, KeyError, TypeError, ZeroDivisionError, pickle.UnpicklingError):
+        pass
+
+    index = scan_record_offsets(path, every, marks)
+    save_row_index(path, index)
+    return index
+
+
+def save_row_index(path, index):
+    # Stamp the index with the source's current size and mtime, then store it
+    stat = os.stat(path)
+    index["size"] = stat.st_size
+    index["mtime_ns"] = stat.st_mtime_ns
+    try:
+        with open(path + ".idx", 'wb') as index_file:
+            pickle.dump(index, index_file)
+    except IOError:
+        print(f"Could not save row index: {path}.idx")
+
+
+def find_record(scan_file, index, row_number, position=0, position_row=0, marks=RECORD_MARKS):
+    # Byte span of one record, scanning forward from the closest checkpoint
+    # (or from `position`, a known record start, if that's closer)
+    if not 0 <= row_number < index["rows"]:
+        raise IndexError(f"Row out of range: {row_number}")
+    checkpoint = row_number // index["every"]
+    start, start_row = index["offsets"][checkpoint], checkpoint * index["every"]
+    if start_row < position_row:
+        start, start_row = position, position_row
+
+    ends = iter_record_ends(scan_file, start, marks)
+    begin = start
+    for _ in range(row_number - start_row):
+        begin = next(ends)
+    end = next(ends)
+    ends.close()
+    return begin, end
+
+
+def count_quotes(path, start, end):
+    # Worker process: the number of quote characters in one byte range of a file
+    with open(path, 'rb') as file:
+        file.seek(start)
+        return file.read(end - start).count(b'"')
+
+
+def next_record_start(file, position, in_quotes=False, marks=RECORD_MARKS):
+    # The first record boundary after byte `position`: just past the next newline that
+    # isn't inside a quoted field. `in_quotes` says whether `position` itself is inside one.
+    if position == 0:
+        return 0
+    file.seek(position)
+    while True:
+        chunk = file.read(1 << 16)
+        if not chunk:
+            return position  # End of file
+        for match in re.finditer(marks, chunk):
+            if match.group() == b'"':
+                in_quotes = not in_quotes
+            elif not in_quotes:
+                return position + match.end()
+        position += len(chunk)
+
+
+def read_records(file, start, end, in_quotes=(False, False), marks=RECORD_MARKS):
+    # The records a worker owns in the nominal byte range [start, end): from the first
+    # boundary after `start` up to the first one after `end`. Neighbouring ranges find
+    # the same boundary between them, so every record is read exactly once.
+    begin = next_record_start(file, start, in_quotes[0], marks)
+    stop = next_record_start(file, end, in_quotes[1], marks)
+    file.seek(begin)
+    return file.read(max(0, stop - begin))
+
+
+def parse_csv_range(path, start, end, in_quotes=(False, False), dialect=None, kinds=None, header=False):
+    # Worker process: parse the records in one byte range of a CSV file. Given column
+    # kinds, they come back as a Table, whose typed columns travel as raw buffers.
+    with open(path, 'rb') as file:
+        text = io.TextIOWrapper(io.BytesIO(read_records(file, start, end, in_quotes)), newline='')
+        rows = csv.reader(text, **(dialect or {}))
+        if kinds is None:
+            return list(rows)
+        return Table.build(rows, kinds, header and start == 0, fallback="text")
+
+
+def parse_jsonl_range(path, start, end):
+    # Worker process: decode the lines in one byte range of a JSON Lines file. Blank
+    # lines are only skipped when nothing but whitespace follows them (see iter_jsonl_rows).
+    with open(path, 'rb') as file:
+        records = read_records(file, start, end, marks=LINE_MARKS)
+        stop = file.tell()
+        size = os.fstat(file.fileno()).st_size
+        if blank_tail(file, size)[0] >= size - stop:
+            records = records.rstrip()  # Nothing but whitespace after this range
+        return [json.loads(line) for line in records.splitlines()]
+
+
+def decode_csv_record(record, dialect=None):
+    # One raw CSV record (bytes, line terminator included) as a row
+    return next(csv.reader(io.TextIOWrapper(io.BytesIO(record), newline=''), **(dialect or {})))
+
+
+def record_terminator(record):
+    # The line terminator a raw record ends with (none for a last line without one)
+    if record.endswith(b"\r\n"):
+        return "\r\n"
+    return "\n" if record.endswith(b"\n") else ""
+
+
+def encode_csv_record(row, dialect=None, terminator="\r\n"):
+    # The bytes csv.writer would produce for a whole row. A record spliced in between
+    # raw ones passes the source's dialect and the terminator of the record it replaces.
+    line = io.StringIO()
+    csv.writer(line, lineterminator=terminator, **(dialect or {})).writerow(row)
+    return line.getvalue().encode(locale.getpreferredencoding(False))
+
+
+def encode_jsonl_record(row, terminator="\n"):
+    return (json.dumps(row, default=list) + terminator).encode()
+
+
+def csv_dialect(path):
+    # The sniffed dialect of a CSV file, for the paths that splice re-encoded records in
+    # between raw ones: those have to be written the way the rest of the file is. Only
+    # the delimiter is taken, so that cells keep any spaces they start with.
+    with open(path, 'r', newline='') as csvfile:
+        dialect = sniff_dialect(csvfile.read(SNIFF_SIZE))
+    return {"delimiter": dialect["delimiter"]} if dialect else {}
+
+
+def field_spans(record):
+    # Byte span of each field in a raw record, leaving out the line terminator
+    body = record.rstrip(b"\r\n")
+    spans = []
+    start = 0
+    in_quotes = False
+    for match in re.finditer(rb'[",]', body):
+        if match.group() == b'"':
+            in_quotes = not in_quotes
+        elif not in_quotes:
+            spans.append((start, match.start()))
+            start = match.end()
+    spans.append((start, len(body)))
+    return spans
+
+
+def encode_field(value):
+    # The bytes csv.writer would produce for this value in the middle of a row
+    line = io.StringIO()
+    csv.writer(line, lineterminator='').writerow([value, ''])
+    return line.getvalue()[:-1].encode(locale.getpreferredencoding(False))
+
+
+def copy_range(source_file, destination_file, start, end):
+    # Copy raw bytes without parsing them. Between two real files the kernel does the
+    # copy (copy_file_range, else sendfile), so the bytes never pass through Python;
+    # whatever those can't handle falls back to a read/write loop.
+    if end <= start:
+        return
+    try:
+        source_fd = source_file.fileno()
+        destination_fd = destination_file.fileno()
+    except (AttributeError, io.UnsupportedOperation):
+        source_fd = None
+
+    if source_fd is not None:
+        destination_file.flush()
+        for kernel_copy in (copy_file_range, sendfile):
+            try:
+                while start < end:
+                    copied = kernel_copy(source_fd, destination_fd, start, end - start)
+                    if not copied:
+                        break
+                    start += copied
+            except (OSError, AttributeError):
+                continue  # Not available here (platform, old kernel, filesystem, ...)
+            break
+        destination_file.seek(0, os.SEEK_END)  # The kernel moved the descriptor's offset
+
+    source_file.seek(start)
+    remaining = end - start
+    while remaining > 0:
+        block = source_file.read(min(remaining, 1 << 20))
+        if not block:
+            break
+        destination_file.write(block)
+        remaining -= len(block)
+
+
+def copy_file_range(source_fd, destination_fd, offset, count):
+    # Writes at (and advances) the destination's current offset
+    return os.copy_file_range(source_fd, destination_fd, count, offset)
+
+
+def sendfile(source_fd, destination_fd, offset, count):
+    return os.sendfile(destination_fd, source_fd, offset, count)
+
+
+# Transparent compression, picked by suffix (or, for sources, by the first bytes)
+COMPRESSION_SUFFIXES = {".gz": "gzip", ".bz2": "bz2", ".xz": "lzma", ".lzma": "lzma"}
+COMPRESSION_MAGIC = [(rb'\x1f\x8b', "gzip"), (rb'BZh[1-9]1AY&SY', "bz2"), (rb'\xfd7zXZ\x00', "lzma")]
+COMPRESSION_MODULES = {"gzip": gzip, "bz2": bz2, "lzma": lzma}
+COMPRESSORS = {
+    "gzip": lambda block: gzip.compress(block, compresslevel=6),
+    "bz2": lambda block: bz2.compress(block),
+    "lzma": lambda block: lzma.compress(block),
+}
+
+
+def compression_of(path, sniff=False):
+    # Compression named by the suffix. With `sniff`, an existing file without such a
+    # suffix is recognised by its magic bytes too.
+    compression = COMPRESSION_SUFFIXES.get(os.path.splitext(path)[1].lower())
+    if compression or not sniff:
+        return compression
+    try:
+        with open(path, 'rb') as file:
+            head = file.read(10)
+    except OSError:
+        return None
+    for magic, compression in COMPRESSION_MAGIC:
+        if re.match(magic, head):
+            return compression
+    return None
+
+
+def strip_compression(path):
+    # The path as format checks should see it: data.csv.gz is a CSV file
+    stem, suffix = os.path.splitext(path)
+    return stem if suffix.lower() in COMPRESSION_SUFFIXES else path
+
+
+def open_file(path, mode='r', compression=None, **kwargs):
+    # open() that decompresses on read and compresses on write. Text modes take the
+    # usual newline/encoding arguments.
+    if compression is None:
+        return open(path, mode, **kwargs)
+    if 'r' in mode:
+        file = COMPRESSION_MODULES[compression].open(path, 'rb')
+    else:
+        file = ParallelCompressedWriter(open(path, 'wb'), COMPRESSORS[compression])
+    return file if 'b' in mode else io.TextIOWrapper(file, **kwargs)
+
+
+class ParallelCompressedWriter(io.BufferedIOBase):
+    # pigz-style writer: the stream is cut into blocks that are compressed independently
+    # on a thread pool (zlib, bz2 and lzma release the GIL while they work) and written in
+    # order. Each block is a complete gzip member / bz2 or xz stream, and the readers
+    # treat the concatenation as one stream.
+    def __init__(self, file, compress, block_size=1 << 20, threads=None):
+        self.file = file
+        self.compress = compress
+        self.block_size = block_size
+        self.threads = threads or os.cpu_count() or 1
+        self.executor = futures.ThreadPoolExecutor(self.threads)
+        self.pending = bytearray()
+        self.futures = deque()
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def tell(self):
+        # Uncompressed bytes written so far
+        return self.position
+
+    def write(self, data):
+        if self.closed:
+            raise ValueError("write to closed file")
+        length = len(memoryview(data).cast('B'))
+        self.pending += data
+        self.position += length
+        while len(self.pending) >= self.block_size:
+            self.submit(bytes(self.pending[:self.block_size]))
+            del self.pending[:self.block_size]
+        return length
+
+    def submit(self, block):
+        # At most two blocks per thread in flight, so memory stays bounded
+        self.futures.append(self.executor.submit(self.compress, block))
+        while len(self.futures) > 2 * self.threads:
+            self.file.write(self.futures.popleft().result())
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            if self.pending or not self.position:
+                self.submit(bytes(self.pending))
+            while self.futures:
+                self.file.write(self.futures.popleft().result())
+        finally:
+            self.executor.shutdown()
+            self.file.close()
+            super().close()
+
+
+# Columnar table kept alongside the plain list-of-rows representation
+INT_MIN, INT_MAX = -(1 << 63), (1 << 63) - 1
+NOT_STORABLE = object()
+
+
+class TextColumn:
+    # Dictionary-encoded strings: one small code per cell, one copy of each distinct value
+    def __init__(self, values=()):
+        self.codes = array('I')
+        self.values = []
+        self.lookup = {}
+        for value in values:
+            self.append(value)
+
+    def code(self, value):
+        code = self.lookup.get(value)
+        if code is None:
+            code = self.lookup[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def append(self, value):
+        self.codes.append(self.code(value))
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, row):
+        return self.values[self.codes[row]]
+
+    def __setitem__(self, row, value):
+        self.codes[row] = self.code(value)
+
+    def __iter__(self):
+        return map(self.values.__getitem__, self.codes)
+
+    def __reduce_ex__(self, protocol):
+        # The lookup dict is rebuilt on load instead of being pickled
+        return unpack_text_column, (pack_column(self.codes, protocol), self.values)
+
+
+def pack_column(column, protocol):
+    # A typed column as (typecode, raw bytes). From protocol 5 on the bytes go out of
+    # band, so a loader can map them straight from a file instead of copying them.
+    if protocol >= 5:
+        return column_typecode(column), pickle.PickleBuffer(column)
+    return column_typecode(column), column.tobytes()
+
+
+def unpack_column(typecode, data):
+    # Writable buffers (memory maps, in-band protocol 5 copies) are used as they are;
+    # read-only bytes are copied into an array
+    view = memoryview(data).cast('B')
+    if view.readonly:
+        return array(typecode, view.tobytes())
+    return view.cast(typecode)
+
+
+def unpack_text_column(codes, values):
+    column = TextColumn()
+    column.codes = unpack_column(*codes)
+    column.values = values
+    column.lookup = {value: code for code, value in enumerate(values)}
+    return column
+
+
+def unpack_table(columns, kinds, header, fallback):
+    columns = [unpack_column(*column) if isinstance(column, tuple) else column for column in columns]
+    return Table(columns, kinds, header, fallback)
+
+
+def column_typecode(column):
+    # Typed columns are arrays, or memoryviews once mapped from a pickle container
+    return column.typecode if isinstance(column, array) else column.format
+
+
+def column_kind(value):
+    # Storage kind for a column whose first value is `value`
+    if isinstance(value, bool):
+        return "bool"
+    if isinstance(value, int):
+        return "int" if INT_MIN <= value <= INT_MAX else "object"
+    if isinstance(value, float):
+        return "float"
+    if isinstance(value, str):
+        return "text"
+    return "object"
+
+
+def new_column(kind):
+    if kind == "int":
+        return array('q')
+    if kind == "float":
+        return array('d')
+    if kind == "bool":
+        return array('B')
+    if kind == "text":
+        return TextColumn()
+    return []
+
+
+def store_value(value, kind):
+    # Value as the column kind stores it, or NOT_STORABLE if that would lose information.
+    # Strings only become numbers when they read back exactly the same ("7" but not "07").
+    if kind == "object":
+        return value
+    if kind == "text":
+        return value if isinstance(value, str) else NOT_STORABLE
+    if isinstance(value, str):
+        try:
+            if kind == "int" and str(int(value)) == value:
+                value = int(value)
+            elif kind == "float" and repr(float(value)) == value:
+                value = float(value)
+            elif kind == "bool" and value in ("True", "False"):
+                value = value == "True"
+        except ValueError:
+            return NOT_STORABLE
+    if column_kind(value) != kind:
+        return NOT_STORABLE
+    return value
+
+
+class Row:
+    # A row of a Table; assigning to a cell writes through to the table
+    def __init__(self, table, row):
+        self.table = table
+        self.row = row
+
+    def __len__(self):
+        return len(self.table.columns)
+
+    def __getitem__(self, column):
+        return self.table.get(self.row, column)
+
+    def __setitem__(self, column, value):
+        self.table.set(self.row, column, value)
+
+    def holds(self, column, value):
+        return self.table.holds(self.row, column, value)
+
+    def __iter__(self):
+        return iter(self.table.row(self.row))
+
+
+class Table:
+    # Column-oriented table: int, float and bool columns are array.array buffers, text
+    # columns are dictionary-encoded and anything mixed falls back to a plain list.
+    # A header row, when there is one, is kept aside so it doesn't spoil the column types.
+    # A table read from a CSV keeps the sniffed dialect, so it is saved the same way.
+    def __init__(self, columns, kinds, header=None, fallback="object"):
+        self.columns = columns
+        self.kinds = kinds
+        self.header = header
+        self.fallback = fallback
+        self.dialect = {}
+
+    @classmethod
+    def build(cls, rows, kinds=None, header=False, fallback="object"):
+        # Build column by column while the rows go past. Ragged rows can't be stored
+        # column-wise; those come back as a plain list of rows instead.
+        if isinstance(rows, Table):
+            return rows
+        rows = iter(rows)
+        header = next(rows, None) if header else None
+        first = next(rows, None)
+        if not isinstance(first, (list, tuple)) or (header is not None and len(header) != len(first)):
+            leading = [value for value in (header, first) if value is not None]
+            return [*leading, *rows]
+
+        kinds = list(kinds or (column_kind(value) for value in first))
+        columns = [new_column(kind) for kind in kinds]
+        table = cls(columns, kinds, header, fallback)
+        for values in chain([first], rows):
+            if not isinstance(values, (list, tuple)) or len(values) != len(columns):
+                return [*table.rows(), values, *rows]
+            for column, value in enumerate(values):
+                stored = store_value(value, table.kinds[column])
+                if stored is NOT_STORABLE:
+                    table.promote(column)
+                    stored = store_value(value, table.kinds[column])
+                table.columns[column].append(stored)
+        return table
+
+    @classmethod
+    def join(cls, parts, kinds=None, header=False):
+        # One CSV table from the tables workers built over consecutive byte ranges. When
+        # a part came back as a row list (ragged rows), the whole file does too.
+        parts = [part for part in parts if len(part)]
+        if not parts or not all(isinstance(part, Table) for part in parts):
+            return cls.build(chain.from_iterable(parts), kinds, header, fallback="text")
+        table = parts[0]
+        for part in parts[1:]:
+            table.extend(part)
+        return table
+
+    def extend(self, other):
+        # Append another table's rows column by column. Where the two disagree on a
+        # column's kind, the narrower side is widened until they match.
+        widths = {"text": 1, "object": 2}
+        for column in range(len(self.columns)):
+            while self.kinds[column] != other.kinds[column]:
+                width, other_width = widths.get(self.kinds[column], 0), widths.get(other.kinds[column], 0)
+                if width <= other_width:
+                    self.promote(column)
+                if other_width <= width:
+                    other.promote(column)
+
+            values, more = self.columns[column], other.columns[column]
+            if isinstance(values, TextColumn):
+                codes = list(map(values.code, more.values))
+                if not isinstance(values.codes, array):
+                    values.codes = array('I', values.codes)
+                values.codes.extend(map(codes.__getitem__, more.codes))
+            elif isinstance(values, list):
+                values.extend(more)
+            else:
+                values = self.columns[column] = array(column_typecode(values), values)
+                values.extend(more)
+
+    def promote(self, column):
+        # Widen a column so it can hold any value: CSV-born tables go back to text,
+        # everything else becomes a plain list
+        values = self.column_values(column)
+        if self.fallback == "text" and self.kinds[column] != "text":
+            self.columns[column] = TextColumn(map(str, values))
+            self.kinds[column] = "text"
+        else:
+            self.columns[column] = list(values)
+            self.kinds[column] = "object"
+
+    def column_values(self, column):
+        if self.kinds[column] == "bool":
+            return map(bool, self.columns[column])
+        return iter(self.columns[column])
+
+    def __reduce_ex__(self, protocol):
+        # Typed columns travel as raw buffers rather than as lists of numbers
+        columns = [pack_column(column, protocol) if isinstance(column, (array, memoryview)) else column
+                   for column in self.columns]
+        return unpack_table, (columns, self.kinds, self.header, self.fallback)
+
+    def __len__(self):
+        rows = len(self.columns[0]) if self.columns else 0
+        return rows if self.header is None else rows + 1
+
+    def __iter__(self):
+        return self.rows()
+
+    def __getitem__(self, row):
+        return Row(self, self.position(row))
+
+    def position(self, row):
+        if row < 0:
+            row += len(self)
+        if not 0 <= row < len(self):
+            raise IndexError(f"Row out of range: {row}")
+        return row
+
+    def rows(self):
+        # Rows as plain lists, decoded one at a time
+        if self.header is not None:
+            yield list(self.header)
+        for values in zip(*(self.column_values(column) for column in range(len(self.columns)))):
+            yield list(values)
+
+    def row(self, row):
+        row = self.position(row)
+        return [self.get(row, column) for column in range(len(self.columns))]
+
+    def get(self, row, column):
+        row = self.position(row)
+        if self.header is not None:
+            if row == 0:
+                return self.header[column]
+            row -= 1
+        value = self.columns[column][row]
+        return bool(value) if self.kinds[column] == "bool" else value
+
+    def holds(self, row, column, value):
+        # Whether setting the cell to `value` would leave it as it is: "1" is no change
+        # to an int cell holding 1. The header row keeps its values as they came.
+        current = self.get(row, column)
+        if self.header is not None and self.position(row) == 0:
+            return current == value
+        stored = store_value(value, self.kinds[column])
+        return stored is not NOT_STORABLE and stored == current
+
+    def set(self, row, column, value):
+        row = self.position(row)
+        if self.header is not None:
+            if row == 0:
+                self.header[column] = value
+                return
+            row -= 1
+        stored = store_value(value, self.kinds[column])
+        if stored is NOT_STORABLE:
+            self.promote(column)
+            stored = store_value(value, self.kinds[column])
+        self.columns[column][row] = stored
+
+
+    def bulk_set(self, column, rows, value):
+        # Set one column for many rows at once. `rows` is a slice, a sequence of row
+        # numbers or a boolean mask with one flag per row. Typed columns are updated
+        # with a single NumPy assignment when NumPy is installed, otherwise with one
+        # array slice assignment (or a loop for scattered rows).
+        # Returns the number of cells that really changed, by the same rule as holds().
+        stored = store_value(value, self.kinds[column])
+        promoted = stored is NOT_STORABLE
+        if promoted:
+            # No cell can hold the value as it is, so every selected cell changes
+            self.promote(column)
+            stored = store_value(value, self.kinds[column])
+
+        selected, header = self.select(rows)
+        changed = int(header and self.header[column] != value)
+        if header:
+            self.header[column] = value
+        if not len(selected):
+            return changed
+        if promoted:
+            changed += len(selected)
+
+        target = self.columns[column]
+        if self.kinds[column] == "text":
+            target, stored = target.codes, target.code(stored)
+
+        numpy = load_numpy()
+        typed = isinstance(target, (array, memoryview))
+        if numpy is not None and typed:
+            view = numpy.frombuffer(target, dtype=column_typecode(target))
+            if isinstance(selected, range):
+                positions = range_slice(selected)
+            else:
+                positions = numpy.asarray(selected, dtype=numpy.intp)
+            if not promoted:
+                changed += int(numpy.count_nonzero(view[positions] != stored))
+            view[positions] = stored
+        elif isinstance(selected, range):
+            if not promoted:
+                values = target[range_slice(selected)]
+                changed += len(selected) - (values.tolist() if isinstance(values, memoryview) else values).count(stored)
+            fill = array(column_typecode(target), [stored]) if typed else [stored]
+            target[range_slice(selected)] = fill * len(selected)
+        else:
+            if not promoted:
+                changed += sum(target[row] != stored for row in selected)
+            for row in selected:
+                target[row] = stored
+        return changed
+
+    def select(self, rows):
+        # Row selection as storage positions (a range or a list), plus whether it
+        # includes the header row
+        count = len(self)
+        if isinstance(rows, slice):
+            selected = range(*rows.indices(count))
+        elif isinstance(rows, int):
+            selected = [self.position(rows)]
+        else:
+            rows = list(rows)
+            if rows and all(isinstance(flag, bool) for flag in rows):
+                if len(rows) != count:
+                    raise IndexError(f"Mask has {len(rows)} flags for {count} rows")
+                selected = list(compress(range(count), rows))
+            else:
+                selected = [self.position(row) for row in rows]
+
+        if self.header is None:
+            return selected, False
+        if isinstance(selected, range):
+            header = 0 in selected
+            if header:
+                selected = selected[1:] if selected[0] == 0 else selected[:-1]
+            if not selected:
+                return range(0), header  # Shifting an empty range could send it negative
+            return range(selected.start - 1, selected.stop - 1, selected.step), header
+        return [row - 1 for row in selected if row], 0 in selected
+
+
+def range_slice(rows):
+    # A range as the equivalent slice (a stop of -1 would mean "last row" in a slice)
+    stop = rows.stop if rows.stop >= 0 else None
+    return slice(rows.start, stop, rows.step)
+
+
+NUMPY = None
+
+
+def load_numpy():
+    # NumPy is optional: bulk edits fall back to array slicing without it.
+    # The import is only attempted once.
+    global NUMPY
+    if NUMPY is None:
+        try:
+            import numpy
+            NUMPY = numpy
+        except ImportError:
+            NUMPY = False
+    return NUMPY or None
+
+
+class Predicate:
+    # "C=V" / "C!=V" in the row field of a change: rows whose column C is (or isn't) V
+    def __init__(self, column, text, negate=False):
+        self.column = column
+        self.text = text
+        self.negate = negate
+
+    def __call__(self, row):
+        return len(row) > self.column and (str(row[self.column]) == self.text) != self.negate
+
+
+def parse_row_selector(text):
+    # Row field of a change: "N", "start:stop[:step]", "i|j|k", "C=V" or "C!=V"
+    if "!=" in text:
+        column, value = text.split("!=", 1)
+        return Predicate(int(column), value, negate=True)
+    if "=" in text:
+        column, value = text.split("=", 1)
+        return Predicate(int(column), value)
+    if ":" in text:
+        parts = text.split(":")
+        if len(parts) > 3:
+            raise ValueError(f"Invalid row range: {text}")
+        return slice(*(int(part) if part else None for part in parts))
+    if "|" in text:
+        return [int(part) for part in text.split("|")]
+    return int(text)
+
+
+def infer_kind(values):
+    # Narrowest kind every sampled CSV string converts to without losing anything
+    for kind in ("int", "float", "bool"):
+        if values and all(store_value(value, kind) is not NOT_STORABLE for value in values):
+            return kind
+    return "text"
+
+
+SNIFF_SIZE = 4096
+
+
+def sniff_dialect(head):
+    # Delimiter (and whether spaces follow it) of a CSV sample; {} means csv's default
+    if len(head) == SNIFF_SIZE and "\n" in head:
+        head = head[:head.rindex("\n") + 1]  # Drop the partial last line
+    try:
+        dialect = csv.Sniffer().sniff(head, delimiters=",;\t|")
+    except csv.Error:
+        return {}
+    return {"delimiter": dialect.delimiter, "skipinitialspace": dialect.skipinitialspace}
+
+
+def sniff_csv(path, sample_size=64 * 1024, compression=None):
+    # Look at the first few KB only: guess the delimiter, whether the first row is a
+    # header and the type of every column. The quote character stays '"' because the
+    # row index relies on it.
+    with open_file(path, 'r', compression, newline='') as csvfile:
+        sample = csvfile.read(sample_size)
+    if len(sample) == sample_size and "\n" in sample:
+        sample = sample[:sample.rindex("\n") + 1]  # Drop the partial last line
+
+    # csv.Sniffer's regular expressions slow down badly on long samples with quoted
+    # fields, so it only sees the first few lines; the kinds use the whole sample
+    head = sample[:SNIFF_SIZE]
+    if len(sample) > SNIFF_SIZE and "\n" in head:
+        head = head[:head.rindex("\n") + 1]
+    dialect = sniff_dialect(head)
+    try:
+        header = csv.Sniffer().has_header(head)
+    except csv.Error:
+        header = False
+
+    rows = list(csv.reader(io.StringIO(sample, newline=''), **dialect))
+    if header:
+        rows = rows[1:]
+    width = len(rows[0]) if rows else 0
+    kinds = [infer_kind([row[column] for row in rows if len(row) > column]) for column in range(width)]
+    return dialect, header, kinds
+
+
+JSON_SPACE = r'[ \t\n\r]*'
+NUMBER_TAIL = "0123456789.eE+-"  # Characters a number can go on with
+
+
+def iter_json_rows(jsonfile, block_size=1 << 16):
+    # Rows of a top-level JSON array, decoded one at a time with raw_decode over a
+    # sliding buffer, so neither the text nor the decoded list is ever held whole
+    decoder = json.JSONDecoder()
+    space = re.compile(JSON_SPACE)
+    buffer = jsonfile.read(block_size)
+    position = 0
+    at_end = not buffer
+
+    def refill():
+        nonlocal buffer, position, at_end
+        more = jsonfile.read(block_size)
+        at_end = not more
+        buffer = buffer[position:] + more
+        position = 0
+
+    def next_token():
+        # Skip whitespace (reading on if needed) and return the next character
+        nonlocal position
+        while True:
+            position = space.match(buffer, position).end()
+            if position < len(buffer) or at_end:
+                return buffer[position:position + 1]
+            refill()
+
+    if next_token() != "[":
+        raise json.JSONDecodeError("Expected a top-level array", buffer, position)
+    position += 1
+    if next_token() == "]":
+        return
+
+    while True:
+        next_token()
+        try:
+            row, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if at_end:
+                raise
+            refill()  # The row runs past the buffer
+            continue
+        if not at_end and isinstance(row, (int, float)) and (end == len(buffer) or buffer[end] in NUMBER_TAIL):
+            refill()  # A number cut by the end of the buffer ("1." of "1.5") might go on
+            continue
+        position = end
+        yield row
+
+        token = next_token()
+        position += 1
+        if token == "]":
+            return
+        if token != ",":
+            raise json.JSONDecodeError("Expected ',' or ']'", buffer, position - 1)
+
+
+JSON_BATCH = 1000
+
+
+def write_json_rows(jsonfile, rows, compact=False):
+    # A JSON array written a batch of rows at a time. The default layout is the same as
+    # json.dump(rows, jsonfile, indent=4); compact puts each row on a line of its own.
+    if compact:
+        encode = json.JSONEncoder(default=list).encode
+    else:
+        indented = json.JSONEncoder(indent=4, default=list).encode
+        encode = lambda row: "    " + indented(row).replace("\n", "\n    ")
+    rows = iter(rows)
+    batch = list(map(encode, islice(rows, JSON_BATCH)))
+    if not batch:
+        jsonfile.write("[]")
+        return
+    jsonfile.write("[\n")
+    while batch:
+        jsonfile.write(",\n".join(batch))
+        batch = list(map(encode, islice(rows, JSON_BATCH)))
+        if batch:
+            jsonfile.write(",\n")
+    jsonfile.write("\n]")
+
+
+PICKLE_MAGIC = b"RDPKL5\0\n"
+BUFFER_ALIGN = 64
+
+
+def dump_pickle_buffers(picklefile, data):
+    # Protocol 5 container: magic, buffer count, stream length and buffer lengths, then
+    # the pickle stream, then every out-of-band buffer on a 64-byte boundary
+    buffers = []
+    stream = pickle.dumps(data, protocol=5, buffer_callback=buffers.append)
+    raws = [buffer.raw() for buffer in buffers]
+    header = struct.pack(f"<8sQQ{len(raws)}Q", PICKLE_MAGIC, len(raws), len(stream), *(raw.nbytes for raw in raws))
+    picklefile.write(header)
+    picklefile.write(stream)
+    position = len(header) + len(stream)
+    for raw in raws:
+        padding = -position % BUFFER_ALIGN
+        picklefile.write(bytes(padding))
+        picklefile.write(raw)
+        position += padding + raw.nbytes
+
+
+def load_pickle_buffers(path, compression=None):
+    # The buffers come back as views of a private memory map of the file: pages are
+    # only read when touched, and edits stay in memory instead of reaching the file.
+    # A compressed file can't be mapped, so it is decompressed into memory instead.
+    with open_file(path, 'rb', compression) as picklefile:
+        if compression:
+            mapped = bytearray(picklefile.read())
+        else:
+            mapped = mmap.mmap(picklefile.fileno(), 0, access=mmap.ACCESS_COPY)
+    return unpack_pickle_buffers(memoryview(mapped))
+
+
+def unpack_pickle_buffers(view):
+    # Unpickle a buffer container held in `view`; the buffers stay views into it
+    magic, count, stream_length = struct.unpack_from("<8sQQ", view)
+    if magic != PICKLE_MAGIC:
+        raise pickle.UnpicklingError("Not a pickle buffer container")
+    position = struct.calcsize(f"<8sQQ{count}Q")
+    lengths = struct.unpack_from(f"<{count}Q", view, struct.calcsize("<8sQQ"))
+    stream = view[position:position + stream_length]
+    position += stream_length
+    buffers = []
+    for length in lengths:
+        position += -position % BUFFER_ALIGN
+        buffers.append(view[position:position + length])
+        position += length
+    return pickle.loads(stream, buffers=buffers)
+
+
+# Chunked pickle: independently pickled batches of rows, then a pickled footer with each
+# batch's offset, length, first row and row count, then the footer offset and the magic
+CHUNKED_MAGIC = b"RDPKLCH\n"
+CHUNK_ROWS = 10000
+TRAILER = "<Q8s"
+
+
+def dump_pickle_chunks(picklefile, rows, batch_rows=CHUNK_ROWS):
+    picklefile.write(CHUNKED_MAGIC)
+    rows = iter(rows)
+    batches = []
+    while True:
+        batch = list(islice(rows, batch_rows))
+        if not batch:
+            break
+        batches.append(write_pickle_batch(picklefile, batch))
+    write_pickle_footer(picklefile, batches)
+
+
+def write_pickle_batch(picklefile, batch):
+    # Returns the batch's (offset, length, row count)
+    offset = picklefile.tell()
+    picklefile.write(pickle.dumps(batch, protocol=pickle.HIGHEST_PROTOCOL))
+    return offset, picklefile.tell() - offset, len(batch)
+
+
+def write_pickle_footer(picklefile, batches):
+    # Footer entries are (offset, length, first row, row count)
+    footer_offset = picklefile.tell()
+    entries = []
+    first_row = 0
+    for offset, length, count in batches:
+        entries.append((offset, length, first_row, count))
+        first_row += count
+    pickle.dump({"rows": first_row, "batches": entries}, picklefile, protocol=pickle.HIGHEST_PROTOCOL)
+    picklefile.write(struct.pack(TRAILER, footer_offset, CHUNKED_MAGIC))
+
+
+def iter_pickle_rows(picklefile):
+    # Rows of any pickle this module writes. A chunked pickle is read one batch at a
+    # time, up to the footer; the other layouts are one object and are loaded whole.
+    magic = picklefile.read(len(CHUNKED_MAGIC))
+    if magic == CHUNKED_MAGIC:
+        while True:
+            batch = pickle.load(picklefile)
+            if isinstance(batch, dict):
+                return  # The footer
+            yield from batch
+    picklefile.seek(0)
+    if magic == PICKLE_MAGIC:
+        yield from unpack_pickle_buffers(memoryview(bytearray(picklefile.read())))
+    else:
+        yield from pickle.load(picklefile)
+
+
+def parse_pickle_batch(path, offset, length):
+    # Worker process: unpickle one batch of a chunked pickle
+    with open(path, 'rb') as file:
+        file.seek(offset)
+        return pickle.loads(file.read(length))
+
+
+JSONL_SUFFIXES = ('.jsonl', '.ndjson')
+
+
+def iter_jsonl_rows(jsonlfile):
+    # One row per line. Blank lines in the middle aren't skipped: line N is always row N,
+    # which is what the line-offset index relies on. Blank lines at the end of the file
+    # are trailing whitespace, and the index doesn't count them either.
+    blank = None
+    for line in jsonlfile:
+        if not line.strip():
+            blank = blank or line
+            continue
+        if blank is not None:
+            json.loads(blank)  # A blank line before this one: not valid JSON
+        yield json.loads(line)
+
+
+def write_jsonl_rows(jsonlfile, rows):
+    # One compact JSON value per line, written a batch of rows at a time
+    encode = json.JSONEncoder(default=list).encode
+    rows = iter(rows)
+    while True:
+        batch = list(map(encode, islice(rows, JSON_BATCH)))
+        if not batch:
+            return
+        jsonlfile.write("\n".join(batch) + "\n")
+
+
+def format_name(path):
+    # What a row file is called in messages
+    codec = codec_for(path)
+    return codec.name if codec else "CSV"
+
+
+PREFETCH_ROWS = 1000
+PREFETCH_DEPTH = 8
+PREFETCH_DONE = object()
+
+
+def prefetch(rows, batch_rows=PREFETCH_ROWS, depth=PREFETCH_DEPTH):
+    # Pull rows on a background thread, a batch at a time, through a bounded queue, so
+    # reading (decompressing, decoding, editing) runs ahead while the caller encodes and
+    # writes. Memory stays at `depth` batches; errors are raised on the caller's side.
+    pending = queue.Queue(depth)
+    stop = threading.Event()
+
+    def produce():
+        try:
+            source = iter(rows)
+            while not stop.is_set():
+                batch = list(islice(source, batch_rows))
+                if not batch:
+                    break
+                pending.put((batch, None))
+        except BaseException as error:
+            pending.put((None, error))
+        finally:
+            pending.put(PREFETCH_DONE)
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    finished = False
+    try:
+        while True:
+            item = pending.get()
+            if item is PREFETCH_DONE:
+                finished = True
+                return
+            batch, error = item
+            if error is not None:
+                raise error
+            yield from batch
+    finally:
+        if not finished:
+            # Stopped early: let the producer see the flag and wind down
+            stop.set()
+            while pending.get() is not PREFETCH_DONE:
+                pass
+        producer.join()
+
+
+class LazyTable:
+    # Rows of a CSV file left as raw bytes in a memory map until they are read or edited.
+    # Saving as CSV copies untouched rows straight from those bytes.
+    def __init__(self, path):
+        self.path = path
+        index = load_row_index(path, every=1)
+        self.offsets = index["offsets"]
+        self.count = index["rows"]
+        self.size = index["size"]
+        self.decoded = {}  # Rows that were handed out for editing, by row number
+        self.dialect = csv_dialect(path)  # Edited rows are written back the same way
+        self.file = open(path, 'rb')
+        self.mapped = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        return self.count
+
+    def span(self, row):
+        end = self.offsets[row + 1] if row + 1 < self.count else self.size
+        return self.offsets[row], end
+
+    def decode(self, row):
+        begin, end = self.span(row)
+        text = io.TextIOWrapper(io.BytesIO(self.mapped[begin:end]), newline='')
+        return next(csv.reader(text, **self.dialect), [])
+
+    def position(self, row):
+        if row < 0:
+            row += self.count
+        if not 0 <= row < self.count:
+            raise IndexError(f"Row out of range: {row}")
+        return row
+
+    def __getitem__(self, row):
+        # The decoded row is kept, so edits made to it stick
+        row = self.position(row)
+        if row not in self.decoded:
+            self.decoded[row] = self.decode(row)
+        return self.decoded[row]
+
+    def __setitem__(self, row, values):
+        self.decoded[self.position(row)] = list(values)
+
+    def __iter__(self):
+        # Decoded one at a time and not kept, unless the row was already handed out
+        for row in range(self.count):
+            yield self.decoded[row] if row in self.decoded else self.decode(row)
+
+    def save_csv(self, destination, compression=None):
+        # Re-encode only rows that really changed, in the source's dialect and with the
+        # line ending each one had; everything else is copied as raw bytes. Goes through
+        # a temporary file, as the destination may be the source.
+        temporary = destination + ".tmp"
+        with open_file(temporary, 'wb', compression) as binary_file:
+            position = 0
+            for row in sorted(self.decoded):
+                values = self.decoded[row]
+                if values == self.decode(row):
+                    continue
+                begin, end = self.span(row)
+                copy_range(self.file, binary_file, position, begin)
+                terminator = record_terminator(self.mapped[begin:end])
+                binary_file.write(encode_csv_record(values, self.dialect, terminator))
+                position = end
+            copy_range(self.file, binary_file, position, self.size)
+        os.replace(temporary, destination)
+
+
+class ChunkedPickle:
+    # Rows of a chunked pickle. A batch is only unpickled when one of its rows is read,
+    # and saving copies batches that weren't edited straight from the source bytes.
+    def __init__(self, path, compression=None):
+        self.path = path
+        self.compression = compression
+        if compression:
+            # Decompressed into memory; raw batch copies then go through plain reads
+            with open_file(path, 'rb', compression) as picklefile:
+                self.file = io.BytesIO(picklefile.read())
+            self.mapped = self.file.getbuffer()
+        else:
+            self.file = open(path, 'rb')
+            self.mapped = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        trailer = len(self.mapped) - struct.calcsize(TRAILER)
+        footer_offset, magic = struct.unpack_from(TRAILER, self.mapped, trailer)
+        if magic != CHUNKED_MAGIC:
+            raise pickle.UnpicklingError("Chunked pickle has no footer")
+        footer = pickle.loads(self.mapped[footer_offset:trailer])
+        self.count = footer["rows"]
+        self.batches = footer["batches"]
+        self.first_rows = [first_row for _, _, first_row, _ in self.batches]
+        self.decoded = {}  # Batches that were handed out for editing, by batch number
+
+    def __len__(self):
+        return self.count
+
+    def decode(self, batch):
+        offset, length, _, _ = self.batches[batch]
+        return pickle.loads(self.mapped[offset:offset + length])
+
+    def position(self, row):
+        if row < 0:
+            row += self.count
+        if not 0 <= row < self.count:
+            raise IndexError(f"Row out of range: {row}")
+        return row
+
+    def locate(self, row):
+        # Batch number and the row's place in that batch
+        row = self.position(row)
+        batch = bisect_right(self.first_rows, row) - 1
+        if batch not in self.decoded:
+            self.decoded[batch] = self.decode(batch)
+        return self.decoded[batch], row - self.first_rows[batch]
+
+    def __getitem__(self, row):
+        # The decoded batch is kept, so edits made to its rows stick
+        rows, place = self.locate(row)
+        return rows[place]
+
+    def __setitem__(self, row, values):
+        rows, place = self.locate(row)
+        rows[place] = list(values)
+
+    def __iter__(self):
+        # Batches are decoded one at a time and not kept, unless already handed out
+        for batch in range(len(self.batches)):
+            yield from self.decoded[batch] if batch in self.decoded else self.decode(batch)
+
+    def peek(self, numbers):
+        # Rows by number without keeping anything: each batch involved is decoded once
+        # and dropped again, so a preview doesn't pin batches in memory
+        rows = {}
+        batch = None
+        for row in sorted(map(self.position, numbers)):
+            number = bisect_right(self.first_rows, row) - 1
+            if number != batch:
+                batch = number
+                decoded = self.decoded[batch] if batch in self.decoded else self.decode(batch)
+            rows[row] = decoded[row - self.first_rows[batch]]
+        return rows
+
+    def read_parallel(self, workers):
+        # Every batch, unpickled in worker processes and joined back in order
+        rows = []
+        offsets = [offset for offset, _, _, _ in self.batches]
+        lengths = [length for _, length, _, _ in self.batches]
+        with futures.ProcessPoolExecutor(workers) as executor:
+            for batch in executor.map(parse_pickle_batch, repeat(self.path), offsets, lengths):
+                rows.extend(batch)
+        return rows
+
+    def save(self, destination, compression=None):
+        # Re-pickle only batches that really changed. Goes through a temporary file, as
+        # the destination may be the source.
+        temporary = destination + ".tmp"
+        with open_file(temporary, 'wb', compression) as picklefile:
+            picklefile.write(CHUNKED_MAGIC)
+            batches = []
+            for batch, (offset, length, _, count) in enumerate(self.batches):
+                rows = self.decoded.get(batch)
+                if rows is not None and rows != self.decode(batch):
+                    batches.append(write_pickle_batch(picklefile, rows))
+                else:
+                    position = picklefile.tell()
+                    copy_range(self.file, picklefile, offset, offset + length)
+                    batches.append((position, length, count))
+            write_pickle_footer(picklefile, batches)
+        os.replace(temporary, destination)
+
+
+class Preview:
+    # Bounded printout of a table: the first and last rows plus a reservoir sample of the
+    # rows in between, so printing costs O(preview) instead of O(rows). Tables that can
+    # be indexed are sampled directly; streams are fed one row at a time with add().
+    def __init__(self, head=5, tail=5, sample=5):
+        self.head_size = head
+        self.tail_size = tail
+        self.sample_size = sample
+        self.head = []
+        self.tail = deque(maxlen=tail)
+        self.sample = []
+        self.middle = 0  # Rows offered to the sample so far
+        self.count = 0
+        self.random = None  # Only created once there is something to sample
+
+    def generator(self):
+        if self.random is None:
+            self.random = random.Random()
+        return self.random
+
+    def add(self, row):
+        entry = (self.count, list(row))
+        self.count += 1
+        if len(self.head) < self.head_size:
+            self.head.append(entry)
+        elif not self.tail_size:
+            self.offer(entry)
+        else:
+            if len(self.tail) == self.tail_size:
+                self.offer(self.tail[0])  # Leaves the tail, so it's a middle row
+            self.tail.append(entry)
+
+    def offer(self, entry):
+        # Reservoir sampling (algorithm R) over the middle rows
+        self.middle += 1
+        if len(self.sample) < self.sample_size:
+            self.sample.append(entry)
+        else:
+            slot = self.generator().randrange(self.middle)
+            if slot < self.sample_size:
+                self.sample[slot] = entry
+
+    def add_table(self, rows):
+        # Only the previewed rows are looked at. Tables with a peek() (chunked pickles)
+        # hand them over without caching what they decoded on the way.
+        self.count = len(rows)
+        head = min(self.head_size, self.count)
+        tail = min(self.tail_size, self.count - head)
+        middle = range(head, self.count - tail)
+        picked = self.generator().sample(middle, self.sample_size) if len(middle) > self.sample_size else middle
+        numbers = [*range(head), *picked, *range(self.count - tail, self.count)]
+        found = rows.peek(numbers) if hasattr(rows, "peek") else {row: rows[row] for row in numbers}
+        self.head = [(row, list(found[row])) for row in range(head)]
+        self.sample = [(row, list(found[row])) for row in picked]
+        self.tail = [(row, list(found[row])) for row in range(self.count - tail, self.count)]
+
+    def passing(self, rows):
+        # Feed a stream while handing its rows on
+        for row in rows:
+            self.add(row)
+            yield row
+
+    def show(self):
+        entries = sorted(self.head + self.sample + list(self.tail), key=itemgetter(0))
+        if len(entries) == self.count:
+            for _, row in entries:
+                print(",".join(map(str, row)))
+            return
+
+        # Something was skipped: number the rows and mark the gaps
+        width = len(str(self.count - 1))
+        previous = -1
+        for number, row in entries:
+            if number > previous + 1:
+                print(f"{'':>{width}}  ... {number - previous - 1} rows ...")
+            print(f"{number:>{width}}  " + ",".join(map(str, row)))
+            previous = number
+        if previous < self.count - 1:
+            print(f"{'':>{width}}  ... {self.count - previous - 1} rows ...")
+        print(f"({self.count} rows, showing {len(entries)}; use --full to print every row)")
+
+
+def dump_rows(rows, align=False, chunk_size=1 << 20, sample_rows=1000):
+    # Full printout at pipe speed: rows are rendered into ~1 MB chunks and every chunk
+    # goes out with a single write on the binary stdout. With align=True the columns
+    # are padded to widths measured on the first `sample_rows` rows.
+    stdout = sys.stdout
+    stdout.flush()  # Keep the order with whatever print() already buffered
+    buffer = getattr(stdout, "buffer", None)
+    encoding = stdout.encoding or "utf-8"
+
+    rows = iter(rows)
+    if align:
+        sampled = [list(map(str, row)) for row in islice(rows, sample_rows)]
+        widths = [max(map(len, cells)) for cells in zip_longest(*sampled, fillvalue="")]
+        rows = chain(sampled, rows)
+
+        def render(row):
+            # Short rows are padded with empty cells; cells past the sampled widths get none
+            cells = list(map(str, row))
+            cells += [""] * (len(widths) - len(cells))
+            return "  ".join(cell.ljust(width) for cell, width in zip_longest(cells, widths, fillvalue=0)).rstrip()
+    else:
+        render = lambda row: ",".join(map(str, row))
+
+    def write(lines):
+        text = "\n".join(lines) + "\n"
+        if buffer is None:
+            stdout.write(text)
+        else:
+            buffer.write(text.encode(encoding, errors="replace"))
+
+    lines = []
+    size = 0
+    for row in rows:
+        line = render(row)
+        lines.append(line)
+        size += len(line) + 1
+        if size >= chunk_size:
+            write(lines)
+            lines = []
+            size = 0
+    if lines:
+        write(lines)
+    if buffer is not None:
+        buffer.flush()
+
+
+CHANGES_SHOWN = 20
+
+
+class ChangeSet:
+    # The raw "column,rows,value" strings compiled once: every string is parsed a single
+    # time, the last change to a cell wins and single-cell edits are grouped by row, in
+    # row order. Changes that address many rows (ranges, row lists, predicates) are kept
+    # as rules and evaluated against each row during the same pass.
+    def __init__(self, changes):
+        self.cells = {}
+        self.rules = []
+        self.changed = []  # The first few cells that changed, for the printout
+        self.changed_count = 0
+        for sequence, change in enumerate(changes):
+            column, rows, value = map(str.strip, change.split(","))
+            self.add(sequence, int(column), parse_row_selector(rows), value)
+
+    # With an undo log (a list), every cell change is logged so that revert() can take
+    # the edit back out of the data
+    undo = None
+
+    def fresh(self):
+        # The same compiled changes with nothing recorded yet, for the next file
+        changes = copy.copy(self)
+        changes.changed = []
+        changes.changed_count = 0
+        return changes
+
+    def add(self, sequence, column, rows, value):
+        if isinstance(rows, int):
+            self.cells[rows, column] = (sequence, value)
+        else:
+            self.rules.append((sequence, rows, column, value))
+
+    def grouped(self, row_count=None):
+        # [(row, {column: (sequence, value)}), ...] sorted by row. Negative rows count
+        # from the end, which needs the row count; a stream doesn't know it upfront.
+        rows = {}
+        for (row, column), change in self.cells.items():
+            if row < 0:
+                if row_count is None:
+                    raise IndexError(f"Negative row in streaming mode: {row}")
+                row += row_count
+            edits = rows.setdefault(row, {})
+            if column not in edits or edits[column] < change:
+                edits[column] = change
+        return sorted(rows.items())
+
+    def prepared_rules(self, row_count=None):
+        # Rules as (sequence, matches(number, row), column, value)
+        prepared = []
+        for sequence, rows, column, value in self.rules:
+            if isinstance(rows, Predicate):
+                matches = lambda number, row, predicate=rows: predicate(row)
+            else:
+                matches = lambda number, row, numbers=self.row_numbers(rows, row_count): number in numbers
+            prepared.append((sequence, matches, column, value))
+        return prepared
+
+    def row_numbers(self, rows, row_count=None):
+        # A slice or row list as something cheap to test membership on
+        if row_count is not None:
+            if isinstance(rows, slice):
+                return range(*rows.indices(row_count))
+            return {row + row_count if row < 0 else row for row in rows}
+
+        if isinstance(rows, slice):
+            start, stop, step = rows.start or 0, rows.stop, rows.step or 1
+            if start < 0 or step < 0 or (stop is not None and stop < 0):
+                raise IndexError("Negative ranges need the row count, which a stream doesn't know")
+            return range(start, sys.maxsize if stop is None else stop, step)
+        if any(row < 0 for row in rows):
+            raise IndexError("Negative row in streaming mode")
+        return set(rows)
+
+    def apply_row(self, number, row, edits, rules=()):
+        # Patch one row with its own edits and every rule that matches it, the latest
+        # change to a cell winning. Predicates see the row as it was before this pass.
+        # Edits that wouldn't change the current value are skipped.
+        if rules:
+            edits = dict(edits)
+            for sequence, matches, column, value in rules:
+                if matches(number, row) and (column not in edits or edits[column][0] < sequence):
+                    edits[column] = (sequence, value)
+        changed = 0
+        typed = isinstance(row, Row)
+        for column, (_, value) in edits.items():
+            if not (row.holds(column, value) if typed else row[column] == value):
+                self.record(number, column, row[column], value)
+                row[column] = value
+                changed += 1
+        return changed
+
+    def record(self, row, column, old, new):
+        if self.undo is not None:
+            self.undo.append((row, column, old))
+        self.changed_count += 1
+        if len(self.changed) < CHANGES_SHOWN:
+            self.changed.append((row, column, old, new))
+
+    def apply_stream(self, rows, row_count=None):
+        # Merge the row-sorted edits and the rules with the rows as they go past
+        rules = self.prepared_rules(row_count)
+        groups = iter(self.grouped(row_count))
+        target, edits = next(groups, (None, None))
+        for number, row in enumerate(rows):
+            if number == target:
+                self.apply_row(number, row, edits, rules)
+                target, edits = next(groups, (None, None))
+            elif rules:
+                self.apply_row(number, row, {}, rules)
+            yield row
+
+        if target is not None:
+            raise IndexError(f"Row out of range: {target}")
+
+    def apply(self, data):
+        # In-memory edit. Without rules only the edited rows are visited; with rules every
+        # row is, in one pass. A Table takes each rule as one bulk column update instead.
+        if isinstance(data, Table) and self.rules:
+            return self.apply_table(data)
+        if not self.rules:
+            for number, edits in self.grouped(len(data)):
+                self.apply_row(number, data[number], edits)
+            return data
+
+        rules = self.prepared_rules(len(data))
+        edited = dict(self.grouped(len(data)))
+        for number, row in enumerate(data):
+            if self.apply_row(number, row, edited.get(number, {}), rules):
+                data[number] = row  # A LazyTable only keeps rows handed back to it
+        return data
+
+    def apply_table(self, table):
+        # Masks for predicates are worked out before anything is written, so they see
+        # the same values the row-by-row pass would
+        updates = []
+        for sequence, rows, column, value in self.rules:
+            if isinstance(rows, Predicate):
+                rows = [rows(row) for row in table]
+            updates.append((sequence, column, rows, value))
+        for row, edits in self.grouped(len(table)):
+            for column, (sequence, value) in edits.items():
+                updates.append((sequence, column, row, value))
+
+        for sequence, column, rows, value in sorted(updates, key=itemgetter(0)):
+            if isinstance(rows, int):
+                if table.holds(rows, column, value):
+                    continue
+                self.record(rows, column, table.get(rows, column), value)
+                table.set(rows, column, value)
+            else:
+                self.changed_count += table.bulk_set(column, rows, value)
+        return table
+
+    def revert(self, data):
+        # Restore the logged cells, latest first
+        for row, column, old in reversed(self.undo or ()):
+            data[row][column] = old
+        self.undo = []
+
+    def __len__(self):
+        return len(self.cells) + len(self.rules)
+
+
+class ExternalChangeSet(ChangeSet):
+    # Changes streamed from a file ("-" for stdin) and sorted by row with a bounded-memory
+    # external merge sort: every `run_size` records are sorted and spilled to a temporary
+    # file, and the runs are merged back lazily when the change set is read
+    def __init__(self, path, changes=(), run_size=1000000):
+        self.count = 0
+        self.runs = []
+        self.rules = []
+        self.changed = []
+        self.changed_count = 0
+        self.directory = None
+        batch = []
+        changes_file = sys.stdin if path == "-" else open(path, 'r', newline='')
+        try:
+            # Changes from the command line come first, so the file wins on the same cell
+            records = chain((change.split(",") for change in changes), csv.reader(changes_file))
+            for sequence, record in enumerate(records):
+                if not record:
+                    continue
+                column, row, value = (field.strip() for field in record)
+                row, column = parse_row_selector(row), int(column)
+                self.count += 1
+                if not isinstance(row, int):
+                    self.rules.append((sequence, row, column, value))  # Rules stay in memory
+                    continue
+                if row < 0:
+                    raise ValueError("Negative rows are not supported with a changes file")
+                batch.append((row, sequence, column, value))
+                if len(batch) >= run_size:
+                    self.spill(batch)
+                    batch = []
+        finally:
+            if changes_file is not sys.stdin:
+                changes_file.close()
+
+        batch.sort()
+        if self.runs and batch:
+            self.spill(batch)
+            batch = []
+        self.batch = batch
+
+    def __getstate__(self):
+        # Worker processes read the runs by path; the directory stays with the parent,
+        # which removes it when it is done
+        state = self.__dict__.copy()
+        state["directory"] = None
+        return state
+
+    def spill(self, batch):
+        # Sort by (row, arrival order) and write the run out
+        if self.directory is None:
+            self.directory = tempfile.TemporaryDirectory(prefix="changes-")
+        batch.sort()
+        path = os.path.join(self.directory.name, f"run{len(self.runs)}.csv")
+        with open(path, 'w', newline='') as run_file:
+            csv.writer(run_file).writerows(batch)
+        self.runs.append(path)
+
+    def read_run(self, path):
+        with open(path, 'r', newline='') as run_file:
+            for row, sequence, column, value in csv.reader(run_file):
+                yield int(row), int(sequence), int(column), value
+
+    def grouped(self, row_count=None):
+        # Same shape as ChangeSet.grouped, but produced lazily from the merged runs
+        if self.runs:
+            records = heapq.merge(*(self.read_run(path) for path in self.runs))
+        else:
+            records = iter(self.batch)
+        for row, group in groupby(records, key=itemgetter(0)):
+            if row_count is not None and row >= row_count:
+                raise IndexError(f"Row out of range: {row}")
+            edits = {}
+            for _, sequence, column, value in group:
+                edits[column] = (sequence, value)  # Records come in arrival order, so the last one wins
+            yield row, edits
+
+    def __len__(self):
+        return self.count
+
 
 class Main:
-    def __init__(self, source, destination, changes):
+    def __init__(self, source, destination, changes, options=None):
         self.source = source
         self.destination = destination
         self.changes = changes
+        self.options = options or {}
+        # Format checks look past a compression suffix: data.csv.gz is read as CSV
+        self.source_compression = compression_of(source, sniff=True)
+        self.destination_compression = compression_of(destination)
+        self.source_name = strip_compression(source)
+        self.destination_name = strip_compression(destination)
 
-class Csv(Main):
-    def __init__(self, source, destination, changes):
-        super().__init__(source, destination, changes)
+    def open_source(self, mode='r', **kwargs):
+        return open_file(self.source, mode, self.source_compression, **kwargs)
+
+    def open_destination(self, mode='w', path=None, **kwargs):
+        # `path` is a temporary file that stands in for the destination
+        return open_file(path or self.destination, mode, self.destination_compression, **kwargs)
 
     def read_file(self):
         
@@ -27,181 +1788,347 @@ class Csv(Main):
             if os.path.getsize(self.source) == 0:
                 print(f"\nSource file is empty: {self.source}\n")
                 sys.exit(1)  # Exit the program
-            
-        if self.source.endswith('.csv'):
-            return self.read_csv()
-        elif self.source.endswith('.json'):
-            return self.read_json()
-        elif self.source.endswith('.pickle'):
-            return self.read_pickle()
-        else:
+
+        # The codec registry picks the reader, by suffix or else by the first bytes
+        codec = codec_for(self.source, sniff=True)
+        if codec is None:
             print('Unsupported file type.')
             return None
-    
-    def list_files_in_directory(self):
-        try:
-            
-            files = [f for f in os.listdir(os.path.dirname(self.source)) if os.path.isfile(os.path.join(os.path.dirname(self.source), f))]
-            print("\nFiles in the directory:\n")
-            print("\n".join(files))
-        except FileNotFoundError:
-            print("\nDirectory not found.")
-            # sys.exit(1)
-    
-    def read_csv(self):
-        try:
-            with open(self.source, 'r', newline='') as csvfile:
-                reader = list(csv.reader(csvfile))
-                print("\nOriginal CSV file:\n")
-                for row in reader:
-                    print(",".join(row))
-                return reader
-        except FileNotFoundError:
-            print(f"File not found: {self.source}")
-            return None
-        
-    def read_json(self):
-        try:
-            with open(self.source, 'r') as jsonfile:
-                data = json.load(jsonfile)
-                print("\nOriginal JSON content:\n")
-                self.print_json_table(data)
-                return data
-        except FileNotFoundError:
-            print(f"File not found: {self.source}")
-            return None
-        except json.JSONDecodeError:
-            print("Error decoding JSON.")
-            return None
-    
-    def print_json_table(self, data):
-        if not data:
-            print("Cannot apply changes. Data not available.")
+        return getattr(self, codec.read)()
+
+    def save_file(self, data_to_save):
+        codec = codec_for(self.destination)
+        if codec is None:
+            print("Unsupported destination file type.")
+            return False
+        saved = getattr(self, codec.save)(data_to_save)
+        self.show_changes()
+        return saved
+
+    def show_rows(self, rows):
+        # Every table printout goes through here: a bounded preview by default, every
+        # row with --full and nothing with --quiet
+        if self.options.get("quiet"):
+            return
+        if self.options.get("full"):
+            dump_rows(rows, align=bool(self.options.get("align")))
             return
+        preview = self.new_preview()
+        if hasattr(rows, "__getitem__") and hasattr(rows, "__len__"):
+            preview.add_table(rows)
+        else:
+            for row in rows:
+                preview.add(row)
+        preview.show()
 
-        for row in data:
-            print(','.join(str(cell) for cell in row))
-        
-    def read_pickle(self):
-        try:
-            with open(self.source, 'rb') as picklefile:
-                data2 = pickle.load(picklefile)
-                print("\nOriginal Pickle content:\n")
-                self.print_pickle_table(data2)
-                return data2
-        except FileNotFoundError:
-            print(f"File not found: {self.source}")
-            return None
-        except pickle.UnpicklingError:
-            print("Error unpickling data.")
-            return None
-        
-    def print_pickle_table(self, data):
-        if not data:
-            print("Cannnot apply changes. Data not available.")
+    def section(self, text):
+        # Section titles, and the blank lines that close a printed table, go out only
+        # when the tables do: --quiet drops them along with the rows
+        if not self.options.get("quiet"):
+            print(text)
+
+    def new_preview(self):
+        return Preview(int(self.options.get("head", 5)), int(self.options.get("tail", 5)),
+                       int(self.options.get("reservoir", 5)))
+
+    def show_changes(self):
+        # The cells that changed, as far as the change set kept track of them
+        if self.options.get("quiet") or not isinstance(self.changes, ChangeSet):
             return
+        changes = self.changes
+        if not changes.changed_count:
+            return
+        print(f"Changed cells ({changes.changed_count}):")
+        for row, column, old, new in changes.changed:
+            print(f"  row {row}, column {column}: {old} -> {new}")
+        if changes.changed_count > len(changes.changed):
+            print("  ...")
+        print("")
 
-        # If data is a list of lists, print it as a table
-        for row in data:
-            print(','.join(str(cell) for cell in row))
+    def stream_file(self):
+        # Constant-memory edit mode: rows are read, patched and written one at a time
+        if codec_for(self.source, sniff=True) is None or codec_for(self.destination) is None:
+            print("Streaming mode supports CSV, JSON, JSON Lines and Pickle source and destination files only.")
+            return False
+
+        if not os.path.isfile(self.source):
+            print(f"\nSource file not found or is not a file: {self.source}")
+            self.list_files_in_directory()  # List files in the same directory
+            sys.exit(1)  # Exit the program
+        elif os.path.getsize(self.source) == 0:
+            print(f"\nSource file is empty: {self.source}\n")
+            sys.exit(1)  # Exit the program
 
-        
-    def apply_changes(self, data):
-        # Method to apply changes to the data
-        if data is None:
-            print("\nCannot apply changes. Data not available.")
-            return None
-        
         try:
-            for change in self.changes:
-                # Split each change into its components: column, row, and value
-                column, row, value = map(str.strip, change.split(","))
+            rules = self.change_set().rules
+        except (ValueError, IndexError):
+            print("\nInvalid change, please retry!")
+            return False
 
-                # Convert column and row to integers
-                column = int(column)
-                row = int(row)
+        # The row index needs CSV or JSON Lines on both sides, and ranges and predicates
+        # need every row anyway
+        line_formats = ('.csv',) + JSONL_SUFFIXES
+        if (self.options.get("index") and not rules and self.source_name.endswith(line_formats)
+                and not (self.source_compression or self.destination_compression)
+                and format_name(self.source_name) == format_name(self.destination_name)):
+            return self.index_rows()
+        return self.stream_rows()
 
-                # Update the value in the specified cell of the CSV data
-                data[row][column] = value
+    def load_csv(self):
+        # Rows of the CSV source. With --table, a sample of the file is sniffed first and
+        # every cell is decoded once, straight into a typed column. With --lazy, rows
+        # stay raw bytes until something reads them.
+        # A compressed source can't be mapped or split, so it is always read in one go.
+        raw = not self.source_compression
+        if self.options.get("lazy") and raw:
+            return LazyTable(self.source)
+        parallel = int(self.options.get("workers", 1)) > 1 and raw
+        if not self.options.get("table"):
+            if parallel:
+                return list(chain.from_iterable(self.read_parallel(parse_csv_range)))
+            with self.open_source('r', newline='') as csvfile:
+                return list(csv.reader(csvfile))
 
-            return data
+        dialect, header, kinds = sniff_csv(self.source, int(self.options.get("sample", 64)) * 1024,
+                                           self.source_compression)
+        if parallel:
+            table = Table.join(self.read_parallel(parse_csv_range, dialect, kinds, header), kinds, header)
+        else:
+            with self.open_source('r', newline='') as csvfile:
+                table = Table.build(csv.reader(csvfile, **dialect), kinds, header, fallback="text")
+        if isinstance(table, Table):
+            table.dialect = dialect
+        return table
+
+    def load_jsonl(self):
+        # Rows of the JSON Lines source, decoded line-parallel with --workers
+        if int(self.options.get("workers", 1)) > 1 and not self.source_compression:
+            rows = list(chain.from_iterable(self.read_parallel(parse_jsonl_range, marks=LINE_MARKS)))
+            return Table.build(rows) if self.options.get("table") else rows
+        with self.open_source('r') as jsonlfile:
+            if self.options.get("table"):
+                return Table.build(iter_jsonl_rows(jsonlfile))
+            return list(iter_jsonl_rows(jsonlfile))
+
+    def load_chunked(self):
+        # Batches are unpickled on demand, or all at once across --workers processes
+        data = ChunkedPickle(self.source, self.source_compression)
+        if int(self.options.get("workers", 1)) > 1 and not self.source_compression:
+            return data.read_parallel(int(self.options["workers"]))
+        return data
+
+    def read_parallel(self, parse_range, *arguments, marks=RECORD_MARKS):
+        # Split the file into equal byte ranges and parse them in worker processes, each
+        # finding the record boundaries at its own ends. For CSV a quote count per range,
+        # also taken in the workers, first tells each one whether its ends fall inside a
+        # quoted field. The parts come back in file order.
+        workers = int(self.options["workers"])
+        size = os.path.getsize(self.source)
+
+        # A few ranges per worker keeps them all busy, capped at about 64 MB each
+        ranges = max(workers * 4, size >> 26)
+        step = max(1, -(-size // ranges))
+        starts = list(range(0, size, step)) or [0]
+        ends = starts[1:] + [size]
+
+        with futures.ProcessPoolExecutor(workers) as executor:
+            columns = [repeat(self.source), starts, ends]
+            if marks == RECORD_MARKS:
+                in_quotes = [False]
+                for count in executor.map(count_quotes, repeat(self.source), starts, ends):
+                    in_quotes.append(in_quotes[-1] != bool(count % 2))
+                columns.append(zip(in_quotes, in_quotes[1:]))
+            return list(executor.map(parse_range, *columns, *map(repeat, arguments)))
+
+    def apply_bulk_changes(self, data):
+        # --bulk: apply the change set to a Table, so every range, row list or predicate
+        # becomes one vectorized column update
+        if data is None:
+            print("\nCannot apply changes. Data not available.")
+            return None
 
-        # Print an error message if there's an issue with the changes
-        except ValueError or IndexError:
+        try:
+            data = Table.build(data)
+            if not isinstance(data, Table):
+                raise ValueError("Bulk edits need rows of equal length")
+            return self.change_set().apply_table(data)
+        except (ValueError, IndexError):
             print("\nInvalid change, please retry!")
             return None
-    
-    def save_file(self, data_to_save):
-        if self.destination.endswith('.csv'):
-            self.save_csv(data_to_save)
-        elif self.destination.endswith('.json'):
-            self.save_json(data_to_save)
-        elif self.destination.endswith('.pickle'):
-            self.save_pickle(data_to_save)
-        else:
-            print("Unsupported destination file type.")
 
-    def save_csv(self, data_csv):
+    def change_set(self):
+        # Compile the raw change strings once per run
+        if not isinstance(self.changes, ChangeSet):
+            self.changes = ChangeSet(self.changes)
+        return self.changes
+
+    def stream_changes(self, rows):
+        # Patch the target cells as their rows go past
+        return self.change_set().apply_stream(rows)
+
+    def stream_rows(self):
+        # Any format to any format in one pass: the source codec yields rows, edits are
+        # applied in flight and the destination codec writes them. With --prefetch,
+        # reading and editing run on a thread of their own and overlap with writing;
+        # that pays off when reads block (slow or remote storage), not when both sides
+        # are busy in Python.
+        # Write to a temporary file first, so a bad change never leaves a half-written
+        # destination behind and source and destination may be the same file
+        temporary = self.destination + ".tmp"
+        preview = self.new_preview()
+        source_codec = codec_for(self.source, sniff=True)
+        destination_codec = codec_for(self.destination)
         try:
-            with open(self.destination, 'w', newline='') as csvfile:
-                writer = csv.writer(csvfile)
-                writer.writerows(data_csv)
-                print("\nModified CSV content saved successfully.\n")
-                for row in data_csv:
-                    print(f",".join(map(str, row)))
-                print("")
+            with open_codec_file(source_codec, self.source, 'r', self.source_compression) as source_file, \
+                    open_codec_file(destination_codec, temporary, 'w', self.destination_compression) as destination_file:
+                rows = self.stream_changes(source_codec.iter_rows(source_file))
+                if self.options.get("prefetch"):
+                    rows = prefetch(rows)
+                destination_codec.write_rows(destination_file, preview.passing(rows), self.options)
+            os.replace(temporary, self.destination)
+        except json.JSONDecodeError:
+            print("Error decoding JSON.")
+            return False
+        except (pickle.UnpicklingError, EOFError):
+            print("Error unpickling data.")
+            return False
+        except (ValueError, IndexError, KeyError, TypeError):
+            # KeyError and TypeError: rows that aren't lists, like JSON objects
+            print("\nInvalid change, please retry!")
+            return False
         except IOError:
             print(f"Error writing to file: {self.destination}")
-    
-    def save_json(self, data_json):
+            return False
+        finally:
+            # Whatever went wrong, no half-written temporary file is left behind
+            if os.path.exists(temporary):
+                os.remove(temporary)
+
+        self.section(f"\nModified {destination_codec.name} content saved successfully ({preview.count} rows streamed).\n")
+        if self.options.get("full") and not self.options.get("quiet"):
+            self.show_destination()
+        elif not self.options.get("quiet"):
+            preview.show()
+            print("")
+        self.show_changes()
+        return True
+
+    def show_destination(self):
+        # --full after a streaming edit: the rows are gone by the time the write is done,
+        # so the destination is read back a row at a time and printed in full
+        codec = codec_for(self.destination)
+        with open_codec_file(codec, self.destination, 'r', self.destination_compression) as destination_file:
+            dump_rows(codec.iter_rows(destination_file), align=bool(self.options.get("align")))
+        print("")
+
+    def patch_in_place(self):
+        # When source and destination are the same CSV and no edit changes a cell's
+        # byte length, overwrite just those bytes through a memory map.
+        # Returns False whenever the normal rewrite is needed instead.
+        if not (self.source_name.endswith('.csv') and self.destination_name.endswith('.csv')):
+            return False
+        if self.source_compression or self.destination_compression:
+            return False  # Compressed bytes can't be patched in place
         try:
-            with open(self.destination, 'w') as jsonfile:
-                json.dump(data_json, jsonfile, indent=4)
-                print("\nModified JSON content saved successfully.\n")
-                self.print_json_table(data_json)
-                print("")
-        except IOError:
-            print(f"Error writing to file: {self.destination}")
+            if not os.path.samefile(self.source, self.destination) or os.path.getsize(self.source) == 0:
+                return False
+            index = load_row_index(self.source, int(self.options.get("index-every", INDEX_EVERY)))
+            changes = self.change_set()
+            if changes.rules:
+                return False  # Ranges and predicates need a full scan
+            pending = changes.grouped(index["rows"])
+        except (OSError, ValueError, IndexError):
+            return False
+        encoding = locale.getpreferredencoding(False)
 
-    def save_pickle(self, data_pickle):
+        with open(self.source, 'r+b') as csvfile, mmap.mmap(csvfile.fileno(), 0) as mapped:
+            # Work out every patch first, so nothing is written unless all of them fit
+            patches = []
+            try:
+                for row_number, edits in pending:
+                    begin, end = find_record(mapped, index, row_number)
+                    record = mapped[begin:end]
+                    spans = field_spans(record)
+                    current = next(csv.reader(io.StringIO(record.decode(encoding), newline='')))
+                    for column, (_, value) in edits.items():
+                        if current[column] == value:
+                            continue  # No-op, nothing to write
+                        field_start, field_end = spans[column]
+                        encoded = encode_field(value)
+                        if len(encoded) != field_end - field_start:
+                            return False
+                        patches.append((begin + field_start, encoded, row_number, column, current[column], value))
+            except (IndexError, StopIteration):
+                return False
+
+            for offset, encoded, row_number, column, old, value in patches:
+                mapped[offset:offset + len(encoded)] = encoded
+                changes.record(row_number, column, old, value)
+            mapped.flush()
+
+        # Record offsets didn't move, so the index only needs the new mtime
+        save_row_index(self.source, index)
+        self.section(f"\nModified CSV content patched in place ({len(patches)} cells).\n")
+        self.show_changes()
+        return True
+
+    def index_rows(self):
+        # Seek straight to the changed rows through the row index; everything in
+        # between is copied as raw bytes instead of being parsed and re-encoded
+        kind = format_name(self.source_name)
+        if kind == "JSON Lines":
+            marks, decode, encode = LINE_MARKS, json.loads, encode_jsonl_record
+        else:
+            # Re-encoded records are spliced in between raw ones, so they are written in
+            # the source's own dialect and keep the line ending they had
+            dialect = csv_dialect(self.source)
+            marks = RECORD_MARKS
+            decode = lambda record: decode_csv_record(record, dialect)
+            encode = lambda row, terminator: encode_csv_record(row, dialect, terminator)
+        index = load_row_index(self.source, int(self.options.get("index-every", INDEX_EVERY)), marks)
+        temporary = self.destination + ".tmp"
+        rows_encoded = 0
         try:
-            with open(self.destination, 'wb') as picklefile:
-                pickle.dump(data_pickle, picklefile)
-                print("\nModified Pickle content saved successfully.\n")
-                self.print_pickle_table(data_pickle)
-                print("")
+            changes = self.change_set()
+            with open(self.source, 'rb') as source_file, open(self.source, 'rb') as scan_file, \
+                    open(temporary, 'wb') as destination_file:
+                position = 0  # Source bytes before `position` are written
+                scanned, scanned_row = 0, 0  # Start of the record after the last one found
+
+                for row_number, edits in changes.grouped(index["rows"]):
+                    begin, end = find_record(scan_file, index, row_number, scanned, scanned_row, marks)
+                    scanned, scanned_row = end, row_number + 1
+                    source_file.seek(begin)
+                    record = source_file.read(end - begin)
+                    row = decode(record)
+                    if not changes.apply_row(row_number, row, edits):
+                        continue  # Only no-ops, the raw bytes can stay
+                    copy_range(source_file, destination_file, position, begin)
+                    destination_file.write(encode(row, record_terminator(record)))
+                    rows_encoded += 1
+                    position = end
+
+                copy_range(source_file, destination_file, position, index["size"])
+            os.replace(temporary, self.destination)
+        except json.JSONDecodeError:
+            print("Error decoding JSON.")
+            return False
+        except (ValueError, IndexError, KeyError, TypeError, StopIteration):
+            print("\nInvalid change, please retry!")
+            return False
         except IOError:
             print(f"Error writing to file: {self.destination}")
+            return False
+        finally:
+            if os.path.exists(temporary):
+                os.remove(temporary)
 
+        self.section(f"\nModified {kind} content saved successfully ({rows_encoded} rows re-encoded through the row index).\n")
+        if self.options.get("full") and not self.options.get("quiet"):
+            self.show_destination()
+        self.show_changes()
+        return True
 
-class Json(Main):
-    def __init__(self, source, destination, changes):
-        super().__init__(source, destination, changes)
-
-    def read_file(self):
-        
-        if not os.path.isfile(self.source):
-                print(f"\nSource file not found or is not a file: {self.source}")
-                with open(self.source, "w")as file:
-                    file.close()
-                    pass
-                self.list_files_in_directory()  # List files in the same directory
-                sys.exit(1)  # Exit the program
-        else:
-            if os.path.getsize(self.source) == 0:
-                print(f"\nSource file is empty: {self.source}\n")
-                sys.exit(1)  # Exit the program
-            
-        if self.source.endswith('.csv'):
-            return self.read_csv()
-        elif self.source.endswith('.json'):
-            return self.read_json()
-        elif self.source.endswith('.pickle'):
-            return self.read_pickle()
-        else:
-            print('Unsupported file type.')
-            return None
-    
     def list_files_in_directory(self):
         try:
             
@@ -214,21 +2141,23 @@ class Json(Main):
     
     def read_csv(self):
         try:
-            with open(self.source, 'r', newline='') as csvfile:
-                reader = list(csv.reader(csvfile))
-                print("\nOriginal CSV file:\n")
-                for row in reader:
-                    print(",".join(row))
-                return reader
+            reader = self.load_csv()
+            self.section("\nOriginal CSV file:\n")
+            self.show_rows(reader)
+            return reader
         except FileNotFoundError:
             print(f"File not found: {self.source}")
             return None
         
     def read_json(self):
         try:
-            with open(self.source, 'r') as jsonfile:
-                data = json.load(jsonfile)
-                print("\nOriginal JSON content:\n")
+            with self.open_source('r') as jsonfile:
+                if self.options.get("table"):
+                    # Columns fill while the rows decode; no full list in between
+                    data = Table.build(iter_json_rows(jsonfile))
+                else:
+                    data = json.load(jsonfile)
+                self.section("\nOriginal JSON content:\n")
                 self.print_json_table(data)
                 return data
         except FileNotFoundError:
@@ -238,25 +2167,47 @@ class Json(Main):
             print("Error decoding JSON.")
             return None
     
+    def read_jsonl(self):
+        try:
+            data = self.load_jsonl()
+            self.section("\nOriginal JSON Lines content:\n")
+            self.print_json_table(data)
+            return data
+        except FileNotFoundError:
+            print(f"File not found: {self.source}")
+            return None
+        except json.JSONDecodeError:
+            print("Error decoding JSON.")
+            return None
+
     def print_json_table(self, data):
         if not data:
             print("Cannot apply changes. Data not available.")
             return
 
-        for row in data:
-            print(','.join(str(cell) for cell in row))
+        self.show_rows(data)
         
     def read_pickle(self):
         try:
-            with open(self.source, 'rb') as picklefile:
-                data2 = pickle.load(picklefile)
-                print("\nOriginal Pickle content:\n")
+            with self.open_source('rb') as picklefile:
+                # Tables saved with out-of-band buffers are mapped, not read
+                magic = picklefile.read(len(PICKLE_MAGIC))
+                if magic == PICKLE_MAGIC:
+                    data2 = load_pickle_buffers(self.source, self.source_compression)
+                elif magic == CHUNKED_MAGIC:
+                    data2 = self.load_chunked()
+                else:
+                    picklefile.seek(0)
+                    data2 = pickle.load(picklefile)
+                if self.options.get("table"):
+                    data2 = Table.build(data2)
+                self.section("\nOriginal Pickle content:\n")
                 self.print_pickle_table(data2)
                 return data2
         except FileNotFoundError:
             print(f"File not found: {self.source}")
             return None
-        except pickle.UnpicklingError:
+        except (pickle.UnpicklingError, struct.error):
             print("Error unpickling data.")
             return None
         
@@ -266,8 +2217,7 @@ class Json(Main):
             return
 
         # If data is a list of lists, print it as a table
-        for row in data:
-            print(','.join(str(cell) for cell in row))
+        self.show_rows(data)
 
         
     def apply_changes(self, data):
@@ -277,241 +2227,683 @@ class Json(Main):
             return None
         
         try:
-            for change in self.changes:
-                # Split each change into its components: column, row, and value
-                column, row, value = map(str.strip, change.split(","))
-
-                # Convert column and row to integers
-                column = int(column)
-                row = int(row)
-
-                # Update the value in the specified cell of the CSV data
-                data[row][column] = value
-
-            return data
+            # Parsed once, last change to a cell wins, applied in row order
+            return self.change_set().apply(data)
 
         # Print an error message if there's an issue with the changes
-        except ValueError or IndexError:
+        except (ValueError, IndexError):
             print("\nInvalid change, please retry!")
             return None
     
-    def save_file(self, data_to_save):
-        if self.destination.endswith('.csv'):
-            self.save_csv(data_to_save)
-        elif self.destination.endswith('.json'):
-            self.save_json(data_to_save)
-        elif self.destination.endswith('.pickle'):
-            self.save_pickle(data_to_save)
-        else:
-            print("Unsupported destination file type.")
-
     def save_csv(self, data_csv):
         try:
-            with open(self.destination, 'w', newline='') as csvfile:
-                writer = csv.writer(csvfile)
-                writer.writerows(data_csv)
-                print("\nModified CSV content saved successfully.\n")
-                for row in data_csv:
-                    print(f",".join(map(str, row)))
-                print("")
+            if isinstance(data_csv, LazyTable):
+                # Rows that were never edited are copied from the source bytes
+                data_csv.save_csv(self.destination, self.destination_compression)
+            else:
+                with self.open_destination('w', newline='') as csvfile:
+                    writer = csv.writer(csvfile, delimiter=getattr(data_csv, "dialect", {}).get("delimiter", ","))
+                    writer.writerows(data_csv)
+            self.section("\nModified CSV content saved successfully.\n")
+            self.show_rows(data_csv)
+            self.section("")
+            return True
         except IOError:
             print(f"Error writing to file: {self.destination}")
+            return False
     
     def save_json(self, data_json):
         try:
-            with open(self.destination, 'w') as jsonfile:
-                json.dump(data_json, jsonfile, indent=4)
-                print("\nModified JSON content saved successfully.\n")
+            with self.open_destination('w') as jsonfile:
+                compact = self.options.get("compact-json")
+                if isinstance(data_json, (list, Table, LazyTable, ChunkedPickle)):
+                    write_json_rows(jsonfile, data_json, compact)
+                else:
+                    json.dump(data_json, jsonfile, indent=None if compact else 4)
+                self.section("\nModified JSON content saved successfully.\n")
                 self.print_json_table(data_json)
-                print("")
+                self.section("")
+            return True
+        except IOError:
+            print(f"Error writing to file: {self.destination}")
+            return False
+
+    def save_jsonl(self, data_jsonl):
+        try:
+            with self.open_destination('w') as jsonlfile:
+                write_jsonl_rows(jsonlfile, data_jsonl)
+                self.section("\nModified JSON Lines content saved successfully.\n")
+                self.print_json_table(data_jsonl)
+                self.section("")
+            return True
         except IOError:
             print(f"Error writing to file: {self.destination}")
+            return False
 
     def save_pickle(self, data_pickle):
         try:
-            with open(self.destination, 'wb') as picklefile:
-                pickle.dump(data_pickle, picklefile)
-                print("\nModified Pickle content saved successfully.\n")
-                self.print_pickle_table(data_pickle)
-                print("")
+            if isinstance(data_pickle, ChunkedPickle):
+                # Batches without edits are copied from the source bytes
+                data_pickle.save(self.destination, self.destination_compression)
+            else:
+                # Columns loaded from a buffer container are views into a mapping of the
+                # source, so the destination is written aside and swapped in: truncating
+                # the source in place would pull the pages out from under them
+                temporary = self.destination + ".tmp"
+                try:
+                    with self.open_destination('wb', temporary) as picklefile:
+                        if self.options.get("chunked"):
+                            dump_pickle_chunks(picklefile, data_pickle, int(self.options.get("chunk-rows", CHUNK_ROWS)))
+                        elif isinstance(data_pickle, Table):
+                            dump_pickle_buffers(picklefile, data_pickle)
+                        else:
+                            pickle.dump(list(data_pickle) if isinstance(data_pickle, LazyTable) else data_pickle, picklefile)
+                    os.replace(temporary, self.destination)
+                finally:
+                    if os.path.exists(temporary):
+                        os.remove(temporary)
+            self.section("\nModified Pickle content saved successfully.\n")
+            self.print_pickle_table(data_pickle)
+            self.section("")
+            return True
         except IOError:
             print(f"Error writing to file: {self.destination}")
+            return False
+
+
+# One reader class per source format; the shared behaviour lives in Main
+class Csv(Main):
+    pass
+
+
+class Json(Main):
+    pass
 
 
 class Pickle(Main):
-    def __init__(self, source, destination, changes):
-        super().__init__(source, destination, changes)
+    pass
 
-    def read_file(self):
-        
-        if not os.path.isfile(self.source):
-                print(f"\nSource file not found or is not a file: {self.source}")
-                with open(self.source, "w")as file:
-                    file.close()
-                    pass
-                self.list_files_in_directory()  # List files in the same directory
-                sys.exit(1)  # Exit the program
-        else:
-            if os.path.getsize(self.source) == 0:
-                print(f"\nSource file is empty: {self.source}\n")
-                sys.exit(1)  # Exit the program
-            
-        if self.source.endswith('.csv'):
-            return self.read_csv()
-        elif self.source.endswith('.json'):
-            return self.read_json()
-        elif self.source.endswith('.pickle'):
-            return self.read_pickle()
-        else:
-            print('Unsupported file type.')
-            return None
-    
-    def list_files_in_directory(self):
-        try:
-            
-            files = [f for f in os.listdir(os.path.dirname(self.source)) if os.path.isfile(os.path.join(os.path.dirname(self.source), f))]
-            print("\nFiles in the directory:\n")
-            print("\n".join(files))
-        except FileNotFoundError:
-            print("\nDirectory not found.")
-            # sys.exit(1)
-    
-    def read_csv(self):
-        try:
-            with open(self.source, 'r', newline='') as csvfile:
-                reader = list(csv.reader(csvfile))
-                print("\nOriginal CSV file:\n")
-                for row in reader:
-                    print(",".join(row))
-                return reader
-        except FileNotFoundError:
-            print(f"File not found: {self.source}")
-            return None
-        
-    def read_json(self):
+
+class Codec:
+    # A file format: the suffixes it goes by, the leading bytes that give it away when
+    # a source has no such suffix, what messages call it, the reader class and Main
+    # methods that read and save it, and how sample rows are written to a new source.
+    # Modules a codec needs are imported lazily, on its first use.
+    # For --stream, iter_rows(file) yields rows and write_rows(file, rows, options)
+    # consumes them, so any codec can feed any other.
+    def __init__(self, name, suffixes, reader, read, save, dump, iter_rows, write_rows, magic=(),
+                 binary=False, newline=None):
+        self.name = name
+        self.suffixes = suffixes
+        self.reader = reader
+        self.read = read
+        self.save = save
+        self.dump = dump
+        self.iter_rows = iter_rows
+        self.write_rows = write_rows
+        self.magic = magic
+        self.binary = binary
+        self.newline = newline
+
+
+CODECS = []
+
+
+def open_codec_file(codec, path, mode, compression=None):
+    # Binary for binary codecs, otherwise text with the codec's newline handling
+    if codec.binary:
+        return open_file(path, mode + 'b', compression)
+    return open_file(path, mode, compression, newline=codec.newline)
+
+
+def register_codec(codec):
+    CODECS.append(codec)
+    return codec
+
+
+def codec_for(path, sniff=False):
+    # Codec by suffix, looking past a compression suffix. With `sniff`, an existing
+    # file with an unknown suffix is recognised by its first bytes.
+    name = strip_compression(path)
+    for codec in CODECS:
+        if name.endswith(codec.suffixes):
+            return codec
+    if not sniff:
+        return None
+    try:
+        with open_file(path, 'rb', compression_of(path, sniff=True)) as file:
+            head = file.read(16)
+    except (OSError, EOFError, lzma.LZMAError):
+        return None
+    for codec in CODECS:
+        if any(re.match(magic, head) for magic in codec.magic):
+            return codec
+    return None
+
+
+register_codec(Codec(
+    "CSV", ('.csv',), Csv, "read_csv", "save_csv",
+    dump=lambda file, rows: csv.writer(file).writerows(rows),
+    iter_rows=lambda file: csv.reader(file),
+    write_rows=lambda file, rows, options: csv.writer(file).writerows(rows),
+    newline=''))
+register_codec(Codec(
+    "JSON", ('.json',), Json, "read_json", "save_json",
+    dump=lambda file, rows: json.dump(rows, file, indent=4),
+    iter_rows=iter_json_rows,
+    write_rows=lambda file, rows, options: write_json_rows(file, rows, options.get("compact-json")),
+    magic=(rb'\s*\[\s*[\[\]{]',)))
+register_codec(Codec(
+    "JSON Lines", JSONL_SUFFIXES, Json, "read_jsonl", "save_jsonl",
+    dump=write_jsonl_rows,
+    iter_rows=iter_jsonl_rows,
+    write_rows=lambda file, rows, options: write_jsonl_rows(file, rows),
+    magic=(rb'\s*[\[{]',)))
+register_codec(Codec(
+    "Pickle", ('.pickle',), Pickle, "read_pickle", "save_pickle",
+    dump=lambda file, rows: pickle.dump(rows, file),
+    iter_rows=iter_pickle_rows,
+    # Streamed pickles are always chunked: that's the layout that can be written and
+    # read back a batch at a time
+    write_rows=lambda file, rows, options: dump_pickle_chunks(file, rows, int(options.get("chunk-rows", CHUNK_ROWS))),
+    magic=(rb'RDPKL5\x00\n', rb'RDPKLCH\n', rb'\x80[\x02-\x05]'),
+    binary=True))
+
+
+def run_edit(source_file, destination_file, changes, options):
+    # One edit job: patch in place, stream, or read, apply and save, as the options ask.
+    # Returns whether the job went through.
+    codec = codec_for(source_file, sniff=True)
+    if codec is None:
+        print("Unsupported file type.")
+        return False
+    if options.get("changes-file") and not isinstance(changes, ChangeSet):
         try:
-            with open(self.source, 'r') as jsonfile:
-                data = json.load(jsonfile)
-                print("\nOriginal JSON content:\n")
-                self.print_json_table(data)
-                return data
-        except FileNotFoundError:
-            print(f"File not found: {self.source}")
-            return None
-        except json.JSONDecodeError:
-            print("Error decoding JSON.")
-            return None
-    
-    def print_json_table(self, data):
-        if not data:
-            print("Cannot apply changes. Data not available.")
-            return
+            changes = ExternalChangeSet(options["changes-file"], changes, int(options.get("run-size", 1000000)))
+        except (ValueError, IndexError):
+            print("\nInvalid change in the changes file, please retry!")
+            return False
+        except IOError:
+            print(f"Changes file not found: {options['changes-file']}")
+            return False
+    reader_instance = codec.reader(source_file, destination_file, changes, options)
 
-        for row in data:
-            print(','.join(str(cell) for cell in row))
-        
-    def read_pickle(self):
+    # In-place patching falls back to a normal rewrite whenever it can't be used
+    if options.get("in-place"):
+        if reader_instance.patch_in_place():
+            return True
+        print("\nIn-place patch not possible, rewriting the whole file.")
+
+    if options.get("stream") or options.get("index"):
+        return reader_instance.stream_file()
+    data = reader_instance.read_file()
+    if options.get("bulk"):
+        modified_data = reader_instance.apply_bulk_changes(data)
+    else:
+        modified_data = reader_instance.apply_changes(data)
+    if modified_data is None:
+        return False  # Whatever went wrong has been printed already
+    return bool(reader_instance.save_file(modified_data))
+
+
+def run_job(job):
+    # Worker process: one batch job, run quietly. Its printout is captured, so the
+    # workers don't interleave, and a SystemExit (how the readers give up on a missing
+    # or empty source) fails the job instead of the worker.
+    source_file, destination_file, changes, options = job
+    output = io.StringIO()
+    started = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(output):
+            done = run_edit(source_file, destination_file, changes, options)
+    except SystemExit:
+        done = False
+    except Exception as error:
+        done = False
+        output.write(f"\n{type(error).__name__}: {error}")
+    try:
+        size = os.path.getsize(source_file)
+    except OSError:
+        size = 0
+    lines = [line for line in output.getvalue().splitlines() if line.strip()]
+    return done, time.perf_counter() - started, size, lines[-1].strip() if lines else ""
+
+
+def read_manifest(path):
+    # Batch jobs as (source, destination, changes). A CSV manifest has one job per row:
+    # source, destination, then one change per cell. A JSON Lines manifest has one
+    # {"source", "destination", "changes"} object or [source, destination, change...]
+    # array per line.
+    jobs = []
+    compression = compression_of(path, sniff=True)
+    if strip_compression(path).endswith(JSONL_SUFFIXES):
+        with open_file(path, 'r', compression) as manifest:
+            for line in manifest:
+                if not line.strip():
+                    continue
+                job = json.loads(line)
+                if isinstance(job, dict):
+                    jobs.append((job["source"], job["destination"], list(job.get("changes", []))))
+                else:
+                    jobs.append((job[0], job[1], list(job[2:])))
+    else:
+        with open_file(path, 'r', compression, newline='') as manifest:
+            for row in csv.reader(manifest):
+                if not row or row[:2] == ["source", "destination"]:
+                    continue  # Blank line or header
+                jobs.append((row[0], row[1], [change for change in row[2:] if change]))
+    return jobs
+
+
+def run_batch(manifest, options):
+    # --batch: every job of the manifest in one interpreter, on a process pool. A
+    # --changes-file is read by every job, on top of the changes of its own.
+    if options.get("changes-file") == "-":
+        print("Batch jobs can't share stdin, give --changes-file a path")
+        return False
+    try:
+        jobs = read_manifest(manifest)
+    except FileNotFoundError:
+        print(f"Manifest not found: {manifest}")
+        return False
+    except (ValueError, IndexError, KeyError, TypeError):
+        print(f"Invalid manifest: {manifest}")
+        return False
+
+    return run_jobs(jobs, options)
+
+
+# --dir workers get the compiled change set once, from the pool initializer
+SHARED_CHANGES = None
+
+
+def share_changes(changes):
+    global SHARED_CHANGES
+    SHARED_CHANGES = changes
+
+
+def run_shared_job(job):
+    source_file, destination_file, options = job
+    return run_job((source_file, destination_file, SHARED_CHANGES.fresh(), options))
+
+
+def run_jobs(jobs, options, shared=None):
+    # Runs (source, destination, changes) jobs over --workers processes (default: one
+    # per CPU), or, given a `shared` change set, (source, destination) jobs that all
+    # apply it. Prints a status line per job, in order, then the totals. Returns
+    # whether every job went through.
+    workers = int(options.get("workers", os.cpu_count() or 1))
+    # Jobs run one process each and quietly; the pool is the parallelism
+    job_options = {name: value for name, value in options.items() if name not in ("batch", "dir", "workers")}
+    job_options["quiet"] = True
+    if shared is None:
+        function, initializer = run_job, None
+        arguments = [(source, destination, changes, job_options) for source, destination, changes in jobs]
+    else:
+        function, initializer = run_shared_job, share_changes
+        arguments = [(source, destination, job_options) for source, destination in jobs]
+
+    started = time.perf_counter()
+    failed = 0
+    total_bytes = 0
+    chunk = max(1, len(jobs) // (workers * 16))
+    with futures.ProcessPoolExecutor(workers, initializer=initializer,
+                                     initargs=() if shared is None else (shared,)) as executor:
+        results = executor.map(function, arguments, chunksize=chunk)
+        for number, (job, (done, seconds, size, message)) in enumerate(zip(jobs, results), 1):
+            failed += not done
+            total_bytes += size
+            status = "ok" if done else "FAILED"
+            print(f"[{number}/{len(jobs)}] {status} {job[0]} -> {job[1]} ({seconds:.3f}s) {message}")
+
+    elapsed = time.perf_counter() - started
+    rate = len(jobs) / elapsed if elapsed else 0.0
+    print(f"\n{len(jobs) - failed} of {len(jobs)} jobs done, {failed} failed, in {elapsed:.2f}s "
+          f"({rate:.1f} jobs/s, {total_bytes / (1 << 20) / elapsed if elapsed else 0.0:.1f} MB/s read)")
+    return not failed
+
+
+# Sidecars the readers leave next to their files, never sources of their own
+SIDECAR_SUFFIXES = (".idx", ".tmp")
+
+
+def find_sources(pattern):
+    # --dir=DIRECTORY or --dir=DIRECTORY/PATTERN: the matching files directly in that
+    # directory, by name
+    if os.path.isdir(pattern):
+        directory, match = pattern, "*"
+    else:
+        directory, match = os.path.split(pattern)
+    with os.scandir(directory or ".") as entries:
+        names = sorted(entry.name for entry in entries
+                       if entry.is_file() and fnmatch.fnmatch(entry.name, match)
+                       and not entry.name.endswith(SIDECAR_SUFFIXES))
+    return [os.path.join(directory, name) for name in names]
+
+
+def destination_for(template, source):
+    # The destination of one --dir source. The template may use {name} (data.csv.gz),
+    # {stem} (data), {ext} (.csv.gz) and {dir} (the source directory); a template
+    # without fields is a directory the files keep their names in.
+    directory, name = os.path.split(source)
+    stem, extension = os.path.splitext(strip_compression(name))
+    extension += name[len(stem) + len(extension):]
+    if "{" not in template:
+        template = os.path.join(template, "{name}")
+    return template.format(name=name, stem=stem, ext=extension, dir=directory or ".")
+
+
+def run_directory(pattern, template, changes, options):
+    # --dir: one change set, compiled once here, applied to every matching file
+    try:
+        sources = find_sources(pattern)
+    except FileNotFoundError:
+        print(f"\nDirectory not found: {pattern}")
+        return False
+    if not sources:
+        print(f"\nNo files match: {pattern}")
+        return False
+
+    if not isinstance(changes, ChangeSet):
         try:
-            with open(self.source, 'rb') as picklefile:
-                data2 = pickle.load(picklefile)
-                print("\nOriginal Pickle content:\n")
-                self.print_pickle_table(data2)
-                return data2
-        except FileNotFoundError:
-            print(f"File not found: {self.source}")
-            return None
-        except pickle.UnpicklingError:
-            print("Error unpickling data.")
-            return None
-        
-    def print_pickle_table(self, data):
-        if not data:
-            print("Cannnot apply changes. Data not available.")
-            return
+            changes = ChangeSet(changes)
+        except (ValueError, IndexError):
+            print("\nInvalid change, please retry!")
+            return False
 
-        # If data is a list of lists, print it as a table
-        for row in data:
-            print(','.join(str(cell) for cell in row))
+    try:
+        jobs = [(source, destination_for(template, source)) for source in sources]
+    except (KeyError, IndexError, ValueError):
+        print(f"\nInvalid destination template: {template}")
+        return False
+    if len(set(destination for _, destination in jobs)) < len(jobs):
+        print(f"\nDestination template maps several files to one: {template}")
+        return False
+    for _, destination in jobs:
+        os.makedirs(os.path.dirname(destination) or ".", exist_ok=True)
+    return run_jobs(jobs, options, shared=changes)
 
-        
-    def apply_changes(self, data):
-        # Method to apply changes to the data
-        if data is None:
-            print("\nCannot apply changes. Data not available.")
-            return None
-        
+
+class ThreadOutput(io.TextIOBase):
+    # sys.stdout for the table server: a request thread that called capture() prints
+    # into its own buffer, everything else goes to the real stdout
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+
+    def capture(self):
+        self.local.buffer = io.StringIO()
+
+    def release(self):
+        buffer, self.local.buffer = self.local.buffer, None
+        return buffer.getvalue()
+
+    def write(self, text):
+        buffer = getattr(self.local, "buffer", None)
+        return (self.stream if buffer is None else buffer).write(text)
+
+    def flush(self):
+        self.stream.flush()
+
+
+def file_stamp(path):
+    # What a cached table is checked against: the file changed if either changed
+    try:
+        status = os.stat(path)
+    except OSError:
+        return None
+    return status.st_mtime_ns, status.st_size
+
+
+class CachedTable:
+    # A parsed source kept in memory by the table server. `lock` is held from the edit
+    # until its write is done, possibly by another thread, so it is a plain Lock.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stamp = None
+        self.data = None
+
+
+# Options the server can't serve from a cached table; those requests run as usual
+UNCACHED_OPTIONS = ("stream", "index", "in-place", "table", "lazy", "bulk")
+CACHE_TABLES = 16
+
+
+class TableServer:
+    # The state behind --serve: parsed tables by source path, and the writer threads.
+    # An edit is applied to the cached table under its lock and written out on a writer
+    # thread. When the destination is another file, the edit is reverted after the
+    # write, so the cached table stays what the source holds.
+    def __init__(self, options):
+        self.tables = {}
+        self.tables_lock = threading.Lock()
+        self.cache_size = int(options.get("cache", CACHE_TABLES))
+        self.writer = futures.ThreadPoolExecutor(int(options.get("workers", 4)))
+        self.pending = set()
+        self.server = None
+
+    def handle(self, request):
+        # One request: {"op": "edit", "argv": [...], "cwd": ..., "wait": true},
+        # {"op": "flush"} or {"op": "stop"}. Returns (ok, output).
+        operation = request.get("op", "edit")
+        if operation == "flush":
+            return True, self.flush()
+        if operation == "stop":
+            output = self.flush()
+            threading.Thread(target=self.server.shutdown).start()
+            return True, output + "Server stopped.\n"
+        if operation != "edit":
+            return False, f"Unknown request: {operation}\n"
+
+        sys.stdout.capture()
         try:
-            for change in self.changes:
-                # Split each change into its components: column, row, and value
-                column, row, value = map(str.strip, change.split(","))
+            done, write = self.edit(request.get("argv", []), request.get("cwd", "."))
+        except SystemExit:
+            done, write = False, None
+        except Exception as error:
+            print(f"\n{type(error).__name__}: {error}")
+            done, write = False, None
+        output = sys.stdout.release()
+        if write is not None and request.get("wait", True):
+            saved, written = write.result()
+            done, output = done and saved, output + written
+        return done, output
 
-                # Convert column and row to integers
-                column = int(column)
-                row = int(row)
+    def edit(self, argv, cwd):
+        # The command line of reader.py, run against the cached table. Returns whether
+        # the edit was accepted and the future of its write, if any.
+        arguments, options = parse_options(argv)
+        if len(arguments) < 2:
+            print("Usage: reader_client.py [options] source_file destination_file change1 change2 ...")
+            return False, None
+        source_file, destination_file = (os.path.join(cwd, path) for path in arguments[:2])
+        changes = arguments[2:]
+        if options.get("changes-file"):
+            try:
+                changes = ExternalChangeSet(os.path.join(cwd, options["changes-file"]), changes,
+                                            int(options.get("run-size", 1000000)))
+            except (ValueError, IndexError):
+                print("\nInvalid change in the changes file, please retry!")
+                return False, None
+            except IOError:
+                print(f"Changes file not found: {options['changes-file']}")
+                return False, None
+        if not changes:
+            print("No changes provided!")
+            return False, None
 
-                # Update the value in the specified cell of the CSV data
-                data[row][column] = value
+        if any(options.get(name) for name in UNCACHED_OPTIONS):
+            return run_edit(source_file, destination_file, changes, options), None
+        codec = codec_for(source_file, sniff=True)
+        if codec is None:
+            print("Unsupported file type.")
+            return False, None
 
-            return data
+        if not isinstance(changes, ChangeSet):
+            try:
+                changes = ChangeSet(changes)
+            except (ValueError, IndexError):
+                print("\nInvalid change, please retry!")
+                return False, None
+        changes.undo = []
+        reader_instance = codec.reader(source_file, destination_file, changes, options)
 
-        # Print an error message if there's an issue with the changes
-        except ValueError or IndexError:
-            print("\nInvalid change, please retry!")
-            return None
-    
-    def save_file(self, data_to_save):
-        if self.destination.endswith('.csv'):
-            self.save_csv(data_to_save)
-        elif self.destination.endswith('.json'):
-            self.save_json(data_to_save)
-        elif self.destination.endswith('.pickle'):
-            self.save_pickle(data_to_save)
-        else:
-            print("Unsupported destination file type.")
+        table = self.table(source_file, reader_instance)
+        if table is None:
+            return False, None
+        # Once the write is queued, the writer releases the lock. Until then a change that
+        # fails, in any way, is taken back out of the table here.
+        try:
+            modified_data = reader_instance.apply_changes(table.data)
+            write = None if modified_data is None else self.writer.submit(
+                self.write, table, reader_instance, modified_data)
+        except BaseException:
+            changes.revert(table.data)
+            table.lock.release()
+            raise
+        if write is None:
+            changes.revert(table.data)
+            table.lock.release()
+            return False, None
+        self.pending.add(write)
+        write.add_done_callback(self.pending.discard)
+        return True, write
 
-    def save_csv(self, data_csv):
+    def table(self, source_file, reader_instance):
+        # The cached table of a source, locked, parsed again if the file changed since
+        with self.tables_lock:
+            table = self.tables.pop(source_file, None) or CachedTable()
+            self.tables[source_file] = table  # Most recently used last
+            for path in list(self.tables)[:-self.cache_size]:
+                if not self.tables[path].lock.locked():
+                    del self.tables[path]
+        table.lock.acquire()
         try:
-            with open(self.destination, 'w', newline='') as csvfile:
-                writer = csv.writer(csvfile)
-                writer.writerows(data_csv)
-                print("\nModified CSV content saved successfully.\n")
-                for row in data_csv:
-                    print(f",".join(map(str, row)))
-                print("")
-        except IOError:
-            print(f"Error writing to file: {self.destination}")
-    
-    def save_json(self, data_json):
+            stamp = file_stamp(source_file)
+            if table.stamp is None or table.stamp != stamp:
+                table.data = reader_instance.read_file()
+                table.stamp = stamp if table.data is not None else None
+        except BaseException:
+            table.lock.release()
+            raise
+        if table.data is None:
+            table.lock.release()
+            return None
+        return table
+
+    def write(self, table, reader_instance, modified_data):
+        # Writer thread: save, then leave the cache matching the source file, and let
+        # the next edit of this table in. Returns whether it saved, and its printout.
+        sys.stdout.capture()
+        saved = False
         try:
-            with open(self.destination, 'w') as jsonfile:
-                json.dump(data_json, jsonfile, indent=4)
-                print("\nModified JSON content saved successfully.\n")
-                self.print_json_table(data_json)
-                print("")
-        except IOError:
-            print(f"Error writing to file: {self.destination}")
+            saved = bool(reader_instance.save_file(modified_data))
+        except Exception as error:
+            print(f"\n{type(error).__name__}: {error}")
+        finally:
+            source, destination = reader_instance.source, reader_instance.destination
+            if os.path.realpath(source) == os.path.realpath(destination):
+                # The edit is now the source; a write that didn't happen drops the cache
+                stamp = file_stamp(source)
+                table.stamp = stamp if stamp != table.stamp else None
+            else:
+                reader_instance.changes.revert(table.data)
+            table.lock.release()
+        return saved, sys.stdout.release()
 
-    def save_pickle(self, data_pickle):
+    def flush(self):
+        # Wait for every write queued so far
+        pending = list(self.pending.copy())
+        futures.wait(pending)
+        return f"{len(pending)} pending writes flushed.\n"
+
+
+def run_server(path, options):
+    # --serve=SOCKET: keep parsed tables in memory and take edits over a Unix socket,
+    # one JSON request per line, one JSON reply ({"ok", "output"}) per request
+    if os.path.exists(path) and stat.S_ISSOCK(os.stat(path).st_mode):
+        os.unlink(path)  # Left behind by a server that didn't stop cleanly
+    state = TableServer(options)
+    sys.stdout = ThreadOutput(sys.stdout)
+
+    class RequestHandler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for line in self.rfile:
+                try:
+                    done, output = state.handle(json.loads(line))
+                except (ValueError, AttributeError):
+                    done, output = False, "Invalid request.\n"
+                self.wfile.write((json.dumps({"ok": done, "output": output}) + "\n").encode())
+
+    with socketserver.ThreadingUnixStreamServer(path, RequestHandler) as server:
+        server.daemon_threads = True
+        state.server = server
+        print(f"Serving tables on {path}")
         try:
-            with open(self.destination, 'wb') as picklefile:
-                pickle.dump(data_pickle, picklefile)
-                print("\nModified Pickle content saved successfully.\n")
-                self.print_pickle_table(data_pickle)
-                print("")
-        except IOError:
-            print(f"Error writing to file: {self.destination}")
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            state.flush()
+            state.writer.shutdown()
+            os.unlink(path)
+    return True
 
 
 if __name__ == "__main__":
-    if len(sys.argv) < 3:
-        print("Usage: python3 reader.py source_file destination_file change1 change2 change3 change4 (Support up to 4 changes at the time)")
+    # Options such as --stream can go anywhere on the command line
+    arguments, options = parse_options(sys.argv[1:])
+
+    # Server mode: tables stay parsed in memory, reader_client.py sends the edits
+    if options.get("serve"):
+        sys.exit(0 if run_server(options["serve"], options) else 1)
+
+    # Batch mode: the jobs come from a manifest instead of the command line
+    if options.get("batch"):
+        sys.exit(0 if run_batch(options["batch"], options) else 1)
+
+    # Directory mode: every matching source, the first argument is the destination template
+    if options.get("dir"):
+        if not arguments or (len(arguments) < 2 and not options.get("changes-file")):
+            print("Usage: python3 reader.py --dir=DIRECTORY[/PATTERN] [--workers=N] [options] destination_template change1 change2 ...")
+            print("The template may use {name}, {stem}, {ext} and {dir}; a plain path is a directory")
+            sys.exit(1)
+        changes = arguments[1:]
+        if options.get("changes-file"):
+            try:
+                changes = ExternalChangeSet(options["changes-file"], changes, int(options.get("run-size", 1000000)))
+            except (ValueError, IndexError):
+                print("\nInvalid change in the changes file, please retry!")
+                sys.exit(1)
+            except IOError:
+                print(f"Changes file not found: {options['changes-file']}")
+                sys.exit(1)
+        sys.exit(0 if run_directory(options["dir"], arguments[0], changes, options) else 1)
+
+    if len(arguments) < 2:
+        print("Usage: python3 reader.py [--stream] [--index] [--in-place] [--workers=N] [--table [--sample=KB]] [--bulk] [--lazy] [--prefetch] [--compact-json] [--chunked [--chunk-rows=N]] [--quiet | --full [--align]] [--head=N] [--tail=N] [--reservoir=N] [--changes-file=PATH|-] [--seed] source_file destination_file change1 change2 ...")
+        print("       python3 reader.py --batch=MANIFEST.csv|.jsonl [--workers=N] [options]")
+        print("       python3 reader.py --dir=DIRECTORY[/PATTERN] [--workers=N] [options] destination_template change1 ...")
+        print("       python3 reader.py --serve=SOCKET [--workers=N] [--cache=N]")
+        print("A change is column,rows,value where rows is N, start:stop[:step], i|j|k, C=V or C!=V")
         sys.exit(1)
 
 
     # Get the source_file, destination_file, and changes from CMD
-    source_file = sys.argv[1]
-    destination_file = sys.argv[2]
-    changes = sys.argv[3:]
+    source_file = arguments[0]
+    destination_file = arguments[1]
+    changes = arguments[2:]
+
+    # Changes can also come from a file (or stdin), in any number and any order
+    if options.get("changes-file"):
+        try:
+            changes = ExternalChangeSet(options["changes-file"], changes, int(options.get("run-size", 1000000)))
+        except (ValueError, IndexError):
+            print("\nInvalid change in the changes file, please retry!")
+            sys.exit(1)
+        except IOError:
+            print(f"Changes file not found: {options['changes-file']}")
+            sys.exit(1)
 
     # Check if changes are provided
     if not changes:
@@ -519,43 +2911,21 @@ if __name__ == "__main__":
         sys.exit(1)
 
 
-    if source_file.endswith('.csv'):
+    # A missing source (or --seed) starts out as the sample data; an existing file is
+    # never overwritten otherwise. The codec registry picks how the sample data is
+    # written, through the same compression the source name asks for.
+    if options.get("seed") or not os.path.exists(source_file):
+        codec = codec_for(source_file)
+        if codec is None:
+            print("Unsupported file type.")
+            sys.exit(1)
+
         data = [
             ["door", 3, 7, 0],
             ["sand", 12, 5, 1],
             ["brush", 22, 34, 5],
             ["poster", "red", 8, "stick"]
         ]
-        with open(source_file, "w", newline='') as csv_file:
-            writer_csv = csv.writer(csv_file)
-            writer_csv.writerows(data)
-        reader_instance = Csv(source_file, destination_file, changes)
-
-    elif source_file.endswith('.json'):
-        data = [
-                ["door", 3, 7, 0],
-                ["sand", 12, 5, 1],
-                ["brush", 22, 34, 5],
-                ["poster", "red", 8, "stick"]
-            ]
-        with open(source_file, "w") as jsonfile:
-            json.dump(data, jsonfile, indent=4)
-        reader_instance = Json(source_file, destination_file, changes)
-
-    elif source_file.endswith('.pickle'):
-        data = [
-                ["door", 3, 7, 0],
-                ["sand", 12, 5, 1],
-                ["brush", 22, 34, 5],
-                ["poster", "red", 8, "stick"]
-            ]
-        with open(source_file, "wb") as picklefile:
-            pickle.dump(data, picklefile)
-        reader_instance = Pickle(source_file, destination_file, changes)
-    else:
-        print("Unsupported file type.")
-        sys.exit(1)
-
-    data = reader_instance.read_file()
-    modified_data = reader_instance.apply_changes(data)
-    reader_instance.save_file(modified_data)
\ No newline at end of file
+        with open_codec_file(codec, source_file, "w", compression_of(source_file)) as source:
+            codec.dump(source, data)
+    sys.exit(0 if run_edit(source_file, destination_file, changes, options) else 1)
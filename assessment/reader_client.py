@@ -0,0 +1,54 @@
+import sys
+import os
+import json
+import socket
+import tempfile
+
+
+# The socket of a running `reader.py --serve=SOCKET`
+SOCKET = os.environ.get("READER_SOCKET", "/tmp/reader.sock")
+
+
+def send(request):
+    # One request, one reply
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.connect(SOCKET)
+        connection.sendall((json.dumps(request) + "\n").encode())
+        with connection.makefile('rb') as replies:
+            return json.loads(replies.readline())
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    # Same arguments as reader.py; the table server does the work. Extra flags:
+    # --async returns once the edit is applied, before the destination is written,
+    # --flush waits for every queued write and --stop shuts the server down.
+    arguments = sys.argv[1:]
+    if "--flush" in arguments:
+        request = {"op": "flush"}
+    elif "--stop" in arguments:
+        request = {"op": "stop"}
+    else:
+        request = {"op": "edit", "argv": [arg for arg in arguments if arg != "--async"],
+                   "cwd": os.getcwd(), "wait": "--async" not in arguments}
+
+    # The server can't read our stdin: --changes-file=- goes over as a temporary file
+    spooled = None
+    if "--changes-file=-" in arguments:
+        with tempfile.NamedTemporaryFile('w', suffix=".csv", delete=False) as spooled:
+            spooled.write(sys.stdin.read())
+        request["argv"][request["argv"].index("--changes-file=-")] = f"--changes-file={spooled.name}"
+
+    try:
+        reply = send(request)
+    except (FileNotFoundError, ConnectionRefusedError):
+        print(f"No table server on {SOCKET}, start one with: python3 reader.py --serve={SOCKET}")
+        sys.exit(1)
+    finally:
+        if spooled is not None:
+            os.unlink(spooled.name)
+
+    print(reply["output"], end="")
+    sys.exit(0 if reply["ok"] else 1)
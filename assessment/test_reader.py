@@ -0,0 +1,805 @@
+import io
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import reader
+
+
+QUIET = {"quiet": True}
+READER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "reader.py")
+
+
+@pytest.fixture(autouse=True)
+def in_tmp_path(tmp_path, monkeypatch):
+    # Every test works on files of its own
+    monkeypatch.chdir(tmp_path)
+
+
+def write_rows(path, rows):
+    codec = reader.codec_for(path)
+    with reader.open_codec_file(codec, path, "w", reader.compression_of(path)) as file:
+        codec.dump(file, rows)
+
+
+def read_rows(path):
+    codec = reader.codec_for(path)
+    with reader.open_codec_file(codec, path, "r", reader.compression_of(path)) as file:
+        return list(codec.iter_rows(file))
+
+
+def test_buffer_container_saved_over_its_own_source():
+    # The columns are views into a mapping of the source: the save must not truncate it
+    rows = [["name", "a", "b"]] + [[f"n{i}", i, i * 0.5] for i in range(50000)]
+    with open("t.pickle", "wb") as picklefile:
+        reader.dump_pickle_buffers(picklefile, reader.Table.build(rows, header=True))
+
+    assert reader.run_edit("t.pickle", "t.pickle", ["1,1,7"], {"table": True, **QUIET})
+
+    table = reader.load_pickle_buffers("t.pickle")
+    assert len(table) == len(rows)
+    assert table.get(1, 1) == 7
+    assert table.get(50000, 2) == 49999 * 0.5
+    assert not os.path.exists("t.pickle.tmp")
+
+
+@pytest.mark.parametrize("rows", [slice(0, 0), slice(2, 2), slice(0, 1), slice(3, 1)])
+def test_empty_bulk_selection_keeps_every_row(rows):
+    table = reader.Table.build([["h", "a"], ["x", 1], ["y", 2], ["z", 3]], header=True)
+    table.bulk_set(1, rows, 9)
+    assert [list(row) for row in table][1:] == [["x", 1], ["y", 2], ["z", 3]]
+    assert len(table) == 4
+
+
+def test_empty_range_change_keeps_the_last_row():
+    rows = [["name", "count"]] + [[f"n{i}", str(i * 11)] for i in range(20)]
+    write_rows("s.csv", rows)
+    assert reader.run_edit("s.csv", "d.csv", ["1,0:0,Z"], {"table": True, **QUIET})
+    with open("d.csv") as csvfile:
+        assert csvfile.read().split() == [",".join(row) for row in rows]
+
+
+BULK_ROWS = [["h", "n", "t"], ["a", 1, "x"], ["b", 1, "y"], ["c", 2, "x"], ["d", 1, "x"], ["e", 3, "y"]]
+
+
+@pytest.fixture(params=["python", "numpy"])
+def bulk_backend(request, monkeypatch):
+    if request.param == "numpy":
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(reader, "NUMPY", False)
+    return request.param
+
+
+@pytest.mark.parametrize("rows", [slice(1, 5), [1, 2, 4, 3], [False, True, True, True, True, False]])
+@pytest.mark.parametrize("column, value, changed", [(1, 1, 1), (1, "1", 1), (2, "x", 1), (1, 7, 4), (1, "1.5", 4)])
+def test_bulk_set_counts_only_real_changes(bulk_backend, rows, column, value, changed):
+    table = reader.Table.build([list(row) for row in BULK_ROWS], header=True)
+    assert table.bulk_set(column, rows, value) == changed
+    assert [table.get(row, column) for row in range(1, 5)] == [reader.store_value(value, table.kinds[column])] * 4
+    assert table.bulk_set(column, rows, value) == 0
+
+
+def test_bulk_change_set_counts_only_real_changes(bulk_backend):
+    table = reader.Table.build([list(row) for row in BULK_ROWS], header=True)
+    changes = reader.ChangeSet(["1,1:5,1", "1,0:1,h", "2,2=y,y"])
+    changes.apply_table(table)
+    assert changes.changed_count == 2  # Row 3 and the header; the "y" rows already hold y
+
+
+@pytest.fixture
+def table_server():
+    server = reader.TableServer({})
+    yield server
+    server.writer.shutdown()
+
+
+def serve_edit(server, *argv):
+    # One edit request (with the per-thread stdout the server runs under), failing the
+    # test instead of hanging on a stuck table lock
+    replies = []
+    stdout, reader.sys.stdout = reader.sys.stdout, reader.ThreadOutput(reader.sys.stdout)
+    try:
+        worker = reader.threading.Thread(target=lambda: replies.append(
+            server.handle({"op": "edit", "argv": ["--quiet", *argv], "cwd": os.getcwd()})), daemon=True)
+        worker.start()
+        worker.join(10)
+    finally:
+        reader.sys.stdout = stdout
+    assert replies, "the table server did not answer"
+    return replies[0]
+
+
+def test_server_failed_edit_releases_the_table(table_server):
+    with open("d.json", "w") as jsonfile:
+        jsonfile.write('[{"a": 1}]')
+    done, output = serve_edit(table_server, "d.json", "o.json", "0,0,x")
+    assert not done and "KeyError" in output
+    done, output = serve_edit(table_server, "d.json", "o.json", "0,0,x")
+    assert not done and "KeyError" in output
+
+
+def test_server_edit_to_another_file_leaves_the_cache_alone(table_server):
+    write_rows("s.csv", [["a", "b"], ["1", "2"]])
+    assert serve_edit(table_server, "s.csv", "o1.csv", "0,1,X")[0]
+    assert serve_edit(table_server, "s.csv", "o2.csv", "1,1,Y")[0]
+    with open("o2.csv") as csvfile:
+        assert csvfile.read().split() == ["a,b", "1,Y"]
+    assert serve_edit(table_server, "s.csv", "s.csv", "0,0,Z")[0]
+    assert serve_edit(table_server, "s.csv", "o3.csv", "1,1,W")[0]
+    with open("o3.csv") as csvfile:
+        assert csvfile.read().split() == ["Z,b", "1,W"]
+
+
+def run_reader(*arguments):
+    return subprocess.run([sys.executable, READER, *arguments], capture_output=True, text=True)
+
+
+@pytest.mark.parametrize("mode", [[], ["--stream"], ["--index"], ["--changes-file=c.csv"]])
+def test_cli_keeps_an_existing_source(mode):
+    with open("s.csv", "w") as csvfile:
+        csvfile.write("a,b\n1,2\n3,4\n")
+    with open("c.csv", "w") as changes_file:
+        changes_file.write("1,2,Y\n")
+    run_reader("--quiet", *mode, "s.csv", "d.csv", "0,1,X")
+    with open("s.csv") as csvfile:
+        assert csvfile.read().split() == ["a,b", "1,2", "3,4"]
+    with open("d.csv") as csvfile:
+        assert csvfile.read().split()[:2] == ["a,b", "X,2"]
+
+
+def test_cli_patches_an_existing_source_in_place():
+    with open("s.csv", "w") as csvfile:
+        csvfile.write("a,b\n1,2\n3,4\n")
+    run_reader("--quiet", "--in-place", "s.csv", "s.csv", "0,1,X")
+    with open("s.csv") as csvfile:
+        assert csvfile.read().split() == ["a,b", "X,2", "3,4"]
+
+
+def test_cli_seeds_a_missing_source():
+    run_reader("--quiet", "new.csv", "d.csv", "0,1,X")
+    with open("new.csv") as csvfile:
+        assert csvfile.readline().strip() == "door,3,7,0"
+    with open("d.csv") as csvfile:
+        assert csvfile.read().split()[1] == "X,12,5,1"
+
+
+@pytest.mark.parametrize("mode", ["--stream", "--index"])
+def test_streaming_full_prints_every_row(mode):
+    write_rows("s.csv", [["a", "b"]] + [[str(i), str(i * 2)] for i in range(3001)])
+    output = run_reader(mode, "--full", "s.csv", "d.csv", "0,1,X").stdout
+    assert "use --full" not in output
+    assert "X,0" in output.split()
+    assert "3000,6000" in output.split()
+
+
+@pytest.mark.parametrize("delimiter", [";", "|", "\t"])
+def test_table_keeps_the_sniffed_delimiter(delimiter):
+    rows = [["name", "count", "price"]] + [[f"n{i}", str(i), f"{i}.5"] for i in range(20)]
+    with open("s.csv", "w") as csvfile:
+        csvfile.write("".join(delimiter.join(row) + "\n" for row in rows))
+    assert reader.run_edit("s.csv", "d.csv", ["0,1,X"], {"table": True, **QUIET})
+    rows[1][0] = "X"
+    with open("d.csv") as csvfile:
+        assert csvfile.read().splitlines() == [delimiter.join(row) for row in rows]
+
+
+@pytest.mark.parametrize("extra", [[], ["1,2:4,7"]])
+def test_typed_cell_set_to_its_own_value_is_no_change(extra):
+    table = reader.Table.build([["a", 1, 1.5, True], ["b", 2, 2.5, False]])
+    changes = reader.ChangeSet(["1,0,1", "2,1,2.5", "3,0,True", "0,1,b", "1,1,3", *extra])
+    changes.apply(table)
+    assert changes.changed == [(1, 1, 2, "3")]
+    assert table.row(1) == ["b", 3, 2.5, False]
+
+
+@pytest.mark.parametrize("text", ["[1.5, 2]", "[1e5, 2]", "[-25000000000.0, 1]", "[12, 3.25e-4, true, [1, 2.5]]"])
+@pytest.mark.parametrize("block_size", [1, 2, 3, 4, 5, 7])
+def test_json_rows_survive_numbers_cut_by_the_block(text, block_size):
+    assert list(reader.iter_json_rows(io.StringIO(text), block_size)) == json.loads(text)
+
+
+def test_batch_reports_why_a_job_failed():
+    write_rows("s.csv", [["a", "b"], ["1", "2"]])
+    with open("jobs.csv", "w") as manifest:
+        manifest.write('source,destination,change\ns.csv,ok.csv,"0,1,X"\ns.csv,bad.csv,"9,1,X"\n')
+    result = run_reader("--batch=jobs.csv", "--workers=2")
+    assert result.returncode == 1
+    lines = result.stdout.splitlines()
+    assert lines[0].startswith("[1/2] ok s.csv -> ok.csv")
+    assert lines[1].startswith("[2/2] FAILED s.csv -> bad.csv") and lines[1].endswith("Invalid change, please retry!")
+
+
+def test_batch_jobs_read_the_changes_file():
+    write_rows("s.csv", [["a", "b"], ["1", "2"]])
+    with open("c.csv", "w") as changes_file:
+        changes_file.write("1,1,Y\n")
+    with open("jobs.jsonl", "w") as manifest:
+        manifest.write(json.dumps({"source": "s.csv", "destination": "d.csv", "changes": ["0,1,X"]}) + "\n")
+    assert run_reader("--batch=jobs.jsonl", "--changes-file=c.csv").returncode == 0
+    with open("d.csv") as csvfile:
+        assert csvfile.read().split() == ["a,b", "X,Y"]
+    assert run_reader("--batch=jobs.jsonl", "--changes-file=-").returncode == 1
+
+
+
+@pytest.mark.parametrize("mode", [[], ["--stream"]])
+def test_single_job_exit_status(mode):
+    write_rows("s.csv", [["a", "b"], ["1", "2"]])
+    assert run_reader("--quiet", *mode, "s.csv", "ok.csv", "0,1,X").returncode == 0
+    result = run_reader("--quiet", *mode, "s.csv", "bad.csv", "9,1,X")
+    assert result.returncode == 1 and "Invalid change, please retry!" in result.stdout
+
+# Rows with the awkward cases: quoted newlines, delimiters and quotes inside fields
+AWKWARD_ROWS = [["id", "name", "note"]] + [
+    [str(i), f"name {i}", ["plain", "with, comma", 'with "quotes"', "two\nlines", "ünïcode", "cr\r\nlf"][i % 6]]
+    for i in range(2500)
+]
+
+
+# The same with LF line endings, as most tools other than csv.writer write them
+LF_ROWS = [[cell.replace("\r\n", "\n") for cell in row] for row in AWKWARD_ROWS]
+# Modes that copy untouched rows as raw bytes, keeping the source's line endings
+SPLICE_MODES = ("index", "lazy")
+
+
+def splices(mode, changes):
+    # --index streams the whole file instead when there are ranges or predicates
+    return mode in SPLICE_MODES and not (mode == "index" and reader.ChangeSet(changes).rules)
+
+
+def write_awkward_csv(path, rows=AWKWARD_ROWS, terminator="\r\n"):
+    with open(path, "w", newline="") as csvfile:
+        reader.csv.writer(csvfile, lineterminator=terminator).writerows(rows)
+
+
+def read_bytes(path):
+    with open(path, "rb") as file:
+        return file.read()
+
+
+def record_spans(rows):
+    # Byte span of every record, as csv.writer lays them out
+    spans, position = [], 0
+    for row in rows:
+        text = io.StringIO(newline="")
+        reader.csv.writer(text).writerow(row)
+        size = len(text.getvalue().encode())
+        spans.append((position, position + size))
+        position += size
+    return spans
+
+
+@pytest.mark.parametrize("every", [1, 7, 1000])
+def test_row_index_skips_quoted_newlines(every):
+    write_awkward_csv("s.csv")
+    index = reader.scan_record_offsets("s.csv", every)
+    spans = record_spans(AWKWARD_ROWS)
+    assert index["rows"] == len(AWKWARD_ROWS)
+    assert list(index["offsets"]) == [start for start, _ in spans[::every]]
+    with open("s.csv", "rb") as scan_file:
+        for row in (0, 3, 4, 5, 999, 1000, 2499):
+            assert reader.find_record(scan_file, index, row) == spans[row]
+        with pytest.raises(IndexError):
+            reader.find_record(scan_file, index, len(AWKWARD_ROWS))
+
+
+def test_row_index_sidecar_follows_the_source():
+    write_awkward_csv("s.csv")
+    assert reader.load_row_index("s.csv", 10)["rows"] == len(AWKWARD_ROWS)
+    assert os.path.exists("s.csv.idx")
+    write_awkward_csv("s.csv", AWKWARD_ROWS[:100])
+    assert reader.load_row_index("s.csv", 10)["rows"] == 100
+
+
+@pytest.mark.parametrize("terminator", ["\r\n", "\n"])
+@pytest.mark.parametrize("workers", [2, 3, 8])
+def test_parallel_read_matches_csv_reader(terminator, workers):
+    # Many small ranges, so plenty of them start or end inside a quoted field
+    rows = AWKWARD_ROWS if terminator == "\r\n" else LF_ROWS
+    write_awkward_csv("s.csv", rows, terminator)
+    with open("s.csv", newline="") as csvfile:
+        expected = list(reader.csv.reader(csvfile))
+    main = reader.Main("s.csv", "d.csv", [], {"workers": workers})
+    assert main.load_csv() == expected
+    table = reader.Main("s.csv", "d.csv", [], {"workers": workers, "table": True}).load_csv()
+    assert table.kinds == reader.Main("s.csv", "d.csv", [], {"table": True}).load_csv().kinds
+    assert [[str(value) for value in row] for row in table] == expected
+
+
+def test_parallel_table_widens_a_column_between_ranges():
+    rows = [["n", "x"]] + [[str(i), str(i)] for i in range(3000)] + [["last", "1.5"]]
+    write_awkward_csv("s.csv", rows, "\n")
+    table = reader.Main("s.csv", "d.csv", [], {"workers": 4, "table": True}).load_csv()
+    assert table.kinds == ["text", "text"]
+    assert list(table) == rows
+
+
+def test_in_place_patch_rewrites_only_the_cells():
+    write_awkward_csv("s.csv")
+    assert reader.run_edit("s.csv", "expected.csv", ["1,3,NAME 3", "2,0,NOTE"], QUIET)
+    inode = os.stat("s.csv").st_ino
+    assert reader.Csv("s.csv", "s.csv", ["1,3,NAME 3", "2,0,NOTE"], QUIET).patch_in_place()
+    assert os.stat("s.csv").st_ino == inode
+    assert read_bytes("s.csv") == read_bytes("expected.csv")
+
+
+@pytest.mark.parametrize("changes", [["1,3,longer name"], ["1,2:4,X"], ["1,4,needs \"quotes\""]])
+def test_in_place_patch_falls_back_to_a_rewrite(changes):
+    write_awkward_csv("s.csv")
+    assert reader.run_edit("s.csv", "expected.csv", changes, QUIET)
+    assert not reader.Csv("s.csv", "s.csv", changes, QUIET).patch_in_place()
+    assert reader.run_edit("s.csv", "s.csv", changes, {"in-place": True, **QUIET})
+    assert read_bytes("s.csv") == read_bytes("expected.csv")
+
+
+def test_change_set_last_change_to_a_cell_wins():
+    changes = reader.ChangeSet(["0,1,one", "1,0,a", "0,1,uno", "0,-1,last", "0,3,three", "2,2,two"])
+    assert changes.grouped(4) == [(0, {1: (1, "a")}), (1, {0: (2, "uno")}), (2, {2: (5, "two")}), (3, {0: (4, "three")})]
+    rows = [["r0", "0", "x"], ["r1", "1", "x"], ["r2", "2", "two"], ["r3", "3", "x"]]
+    changes.apply(rows)
+    assert rows == [["r0", "a", "x"], ["uno", "1", "x"], ["r2", "2", "two"], ["three", "3", "x"]]
+    assert changes.changed_count == 3  # "two" was already there
+
+
+@pytest.mark.parametrize("change", ["0,1", "0,1,2,3", "a,1,x", "0,a,x", ""])
+def test_malformed_changes_are_rejected(change):
+    with pytest.raises(ValueError):
+        reader.ChangeSet([change])
+
+
+@pytest.mark.parametrize("change", ["0,4,x", "5,0,x", "0,-5,x"])
+def test_out_of_range_changes_are_rejected(change):
+    with pytest.raises(IndexError):
+        reader.ChangeSet([change]).apply([["a", "b"], ["c", "d"]])
+
+
+def test_external_change_set_spills_and_merges_in_order():
+    # Repeated cells, and values a run file has to quote
+    picks = reader.random.Random(9)
+    records = [(picks.randrange(3), picks.randrange(25), f'v{number}, "q"') for number in range(60)]
+    inline = [f"{column},{row},v{number}" for number, (column, row, _) in enumerate(records[:10])]
+    with open("c.csv", "w", newline="") as changes_file:
+        reader.csv.writer(changes_file).writerows(records[10:])
+    external = reader.ExternalChangeSet("c.csv", inline, run_size=7)
+    assert len(external.runs) == 9 and len(external) == 60
+
+    expected = reader.ChangeSet(inline)
+    for sequence, (column, row, value) in enumerate(records[10:], 10):
+        expected.add(sequence, column, row, value)
+    assert list(external.grouped(25)) == expected.grouped(25)
+
+
+def test_changes_file_edit_matches_inline_changes():
+    write_awkward_csv("s.csv")
+    changes = [f"{number % 3},{number * 37 % 2500},c{number}" for number in range(100)]
+    with open("c.csv", "w") as changes_file:
+        changes_file.write("\n".join(changes) + "\n")
+    assert reader.run_edit("s.csv", "inline.csv", changes, QUIET)
+    for mode in ({}, {"stream": True}, {"index": True}):
+        assert reader.run_edit("s.csv", "file.csv", reader.ExternalChangeSet("c.csv", run_size=7), {**mode, **QUIET})
+        assert read_bytes("file.csv") == read_bytes("inline.csv")
+
+
+@pytest.mark.parametrize("text, selector", [
+    ("4", 4),
+    ("-1", -1),
+    ("2:8", slice(2, 8)),
+    ("::2", slice(None, None, 2)),
+    ("1:-1:3", slice(1, -1, 3)),
+    ("1|5|9", [1, 5, 9]),
+])
+def test_row_selectors(text, selector):
+    assert reader.parse_row_selector(text) == selector
+
+
+def test_predicate_selectors():
+    equal = reader.parse_row_selector("2=a=b")
+    different = reader.parse_row_selector("0!=x")
+    assert (equal.column, equal.text, equal.negate) == (2, "a=b", False)
+    assert (different.column, different.text, different.negate) == (0, "x", True)
+    assert equal(["x", "y", "a=b"]) and not equal(["x", "y"])
+    assert different(["y"]) and not different(["x"])
+
+
+def test_change_set_grammar():
+    rows = [[f"r{i}", str(i), "x" if i % 2 else "y"] for i in range(10)]
+    changes = reader.ChangeSet([
+        "0,1,one", "0,1,uno",  # The last change to a cell wins
+        "0,-1,last",
+        "1,2:6:2,even",
+        "1,7|8,list",
+        "1,2=x,odd",  # Later than the range, so it wins on the rows both cover
+        " 2 , 0 , spaced ",
+    ])
+    changes.apply(rows)
+    assert [row[0] for row in rows] == ["r0", "uno", *(f"r{i}" for i in range(2, 9)), "last"]
+    assert [row[1] for row in rows] == ["0", "odd", "even", "odd", "even", "odd", "6", "odd", "list", "odd"]
+    assert rows[0][2] == "spaced"
+
+
+@pytest.mark.parametrize("change", ["0,1:b,x", "0,1:2:3:4,x", "0,a=b,x", "0,1|x,x"])
+def test_malformed_row_selectors_are_rejected(change):
+    with pytest.raises(ValueError):
+        reader.ChangeSet([change])
+
+
+CHANGE_SETS = [
+    ["1,3,X"],
+    ["2,0,Note", "1,4,Y", "1,4,Z", "0,2499,last"],
+    ["2,5,short"],
+    ["1,10:20:3,R", "1,7|9|11,L"],
+    ["2,2=name 8,P", "1,1!=x,N"],
+]
+
+
+@pytest.mark.parametrize("changes", CHANGE_SETS)
+@pytest.mark.parametrize("terminator", ["\r\n", "\n"])
+@pytest.mark.parametrize("mode", ["stream", "index", "lazy", "table"])
+def test_edit_modes_write_the_same_bytes(changes, terminator, mode):
+    write_awkward_csv("s.csv", AWKWARD_ROWS if terminator == "\r\n" else LF_ROWS, terminator)
+    assert reader.run_edit("s.csv", "memory.csv", changes, QUIET)
+    assert reader.run_edit("s.csv", "mode.csv", changes, {mode: True, **QUIET})
+    expected = read_bytes("memory.csv")
+    if splices(mode, changes):
+        expected = expected.replace(b"\r\n", terminator.encode())
+    assert read_bytes("mode.csv") == expected
+
+
+@pytest.mark.parametrize("changes", CHANGE_SETS)
+@pytest.mark.parametrize("mode", ["stream", "index", "table"])
+def test_jsonl_edit_modes_write_the_same_bytes(changes, mode):
+    write_rows("s.jsonl", AWKWARD_ROWS)
+    assert reader.run_edit("s.jsonl", "memory.jsonl", changes, QUIET)
+    assert reader.run_edit("s.jsonl", "mode.jsonl", changes, {mode: True, **QUIET})
+    assert read_bytes("mode.jsonl") == read_bytes("memory.jsonl")
+
+
+@pytest.mark.parametrize("mode", SPLICE_MODES)
+@pytest.mark.parametrize("source, expected", [
+    (b"a,b\n1,2\n3,4\n", b"a,b\n1,Y\n3,4\n"),
+    (b"a;b\n1;2\n3;4\n", b"a;b\n1;Y\n3;4\n"),
+    (b"a\tb\r\n1\t2\r\n3\t4", b"a\tb\r\n1\tY\r\n3\t4"),
+    (b"a|b\n1|2\n3|4", b"a|b\n1|2\n3|Y"),
+])
+def test_spliced_rows_keep_the_source_format(mode, source, expected):
+    with open("s.csv", "wb") as csvfile:
+        csvfile.write(source)
+    change = "1,2,Y" if expected.endswith(b"Y") else "1,1,Y"
+    assert reader.run_edit("s.csv", "d.csv", [change], {mode: True, **QUIET})
+    assert read_bytes("d.csv") == expected
+
+
+def unavailable(*arguments):
+    raise OSError("not here")
+
+
+KERNEL_COPY = reader.copy_file_range
+
+
+def copy_file_range_once(source_fd, destination_fd, offset, count):
+    # Copies one short piece, then gives up the way an unsupported filesystem does
+    if os.lseek(destination_fd, 0, os.SEEK_CUR) > 4:
+        raise OSError("not here")
+    return KERNEL_COPY(source_fd, destination_fd, offset, min(count, 1000))
+
+
+@pytest.mark.parametrize("kernel", ["native", "sendfile", "none", "partial"])
+def test_copy_range_splices_between_writes(kernel, monkeypatch):
+    if kernel in ("sendfile", "none"):
+        monkeypatch.setattr(reader, "copy_file_range", unavailable)
+    if kernel == "none":
+        monkeypatch.setattr(reader, "sendfile", unavailable)
+    if kernel == "partial":
+        monkeypatch.setattr(reader, "copy_file_range", copy_file_range_once)
+    data = os.urandom(3 << 20)
+    with open("s.bin", "wb") as source_file:
+        source_file.write(data)
+    with open("s.bin", "rb") as source_file, open("d.bin", "wb") as destination_file:
+        destination_file.write(b"head")
+        reader.copy_range(source_file, destination_file, 100, 2500000)
+        destination_file.write(b"mid")
+        reader.copy_range(source_file, destination_file, 0, 10)
+        reader.copy_range(source_file, destination_file, 5, 5)
+        reader.copy_range(source_file, destination_file, len(data) - 7, len(data))
+        destination_file.write(b"tail")
+    assert read_bytes("d.bin") == b"head" + data[100:2500000] + b"mid" + data[:10] + data[-7:] + b"tail"
+
+
+def test_copy_range_without_file_descriptors():
+    source_file, destination_file = io.BytesIO(b"0123456789" * 300000), io.BytesIO()
+    destination_file.write(b">")
+    reader.copy_range(source_file, destination_file, 3, 2999999)
+    destination_file.write(b"<")
+    assert destination_file.getvalue() == b">" + source_file.getvalue()[3:2999999] + b"<"
+
+
+CHUNKED_ROWS = [[i, f"row {i}", i / 4] for i in range(100)]
+
+
+def write_chunked(path, rows=CHUNKED_ROWS, batch_rows=7):
+    with open(path, "wb") as picklefile:
+        reader.dump_pickle_chunks(picklefile, rows, batch_rows)
+
+
+def batch_bytes(data):
+    return [bytes(data.mapped[offset:offset + length]) for offset, length, _, _ in data.batches]
+
+
+def test_chunked_pickle_reads_rows_by_batch():
+    write_chunked("s.pkl")
+    data = reader.ChunkedPickle("s.pkl")
+    assert len(data) == 100 and len(data.batches) == 15
+    assert [count for _, _, _, count in data.batches] == [7] * 14 + [2]
+    assert data[50] == CHUNKED_ROWS[50] and data[-1] == CHUNKED_ROWS[-1]
+    assert list(data) == CHUNKED_ROWS
+    assert sorted(data.decoded) == [7, 14]
+    with pytest.raises(IndexError):
+        data[100]
+
+
+def test_chunked_pickle_save_copies_untouched_batches():
+    write_chunked("s.pkl")
+    data = reader.ChunkedPickle("s.pkl")
+    data[10] = ["edited"]
+    data[30]  # Decoded but left as it was
+    data.save("d.pkl")
+    saved = reader.ChunkedPickle("d.pkl")
+    assert list(saved) == CHUNKED_ROWS[:10] + [["edited"]] + CHUNKED_ROWS[11:]
+    source, copied = batch_bytes(data), batch_bytes(saved)
+    assert copied[1] != source[1]
+    assert copied[:1] + copied[2:] == source[:1] + source[2:]
+
+
+def test_chunked_pickle_read_parallel():
+    write_chunked("s.pkl")
+    assert reader.ChunkedPickle("s.pkl").read_parallel(3) == CHUNKED_ROWS
+
+
+def test_preview_of_a_chunked_pickle_keeps_no_batches():
+    write_chunked("s.pkl")
+    data = reader.ChunkedPickle("s.pkl")
+    data[50] = ["edited"]
+    preview = reader.Preview(head=5, tail=5, sample=3)
+    preview.add_table(data)
+    assert sorted(data.decoded) == [7]
+    assert [row for _, row in preview.head] == CHUNKED_ROWS[:5]
+    assert [row for _, row in preview.tail] == CHUNKED_ROWS[-5:]
+    for number, row in preview.sample:
+        assert row == (["edited"] if number == 50 else CHUNKED_ROWS[number])
+
+
+def test_dump_rows_unaligned(capsys):
+    reader.dump_rows([["a", 1, 2.5], [], ["b"]], chunk_size=4)
+    assert capsys.readouterr().out == "a,1,2.5\n\nb\n"
+
+
+def test_dump_rows_aligned_pads_with_blanks(capsys):
+    rows = [["id", "name", "note"], [1, "ab"], [22, "a", "long note"], [3], [4, "b", "c", "extra"]]
+    reader.dump_rows(rows, align=True, sample_rows=3)
+    assert capsys.readouterr().out.splitlines() == [
+        "id  name  note",
+        "1   ab",
+        "22  a     long note",
+        "3",
+        "4   b     c          extra",
+    ]
+
+
+def read_jsonl(path):
+    with open(path) as jsonlfile:
+        return [reader.json.loads(line) for line in jsonlfile if line.strip()]
+
+
+@pytest.mark.parametrize("tail", [b"\n", b"\n\n", b"\n \n\t\r\n", b"  ", b" \n\n"])
+@pytest.mark.parametrize("mode", [{}, {"stream": True}, {"index": True}, {"workers": 2}])
+def test_jsonl_blank_lines_at_the_end_are_not_rows(tail, mode):
+    with open("s.jsonl", "wb") as jsonlfile:
+        jsonlfile.write(b'[1, 2]\n["a", "b"]' + tail)
+    assert reader.scan_record_offsets("s.jsonl", 1, reader.LINE_MARKS)["rows"] == 2
+    assert reader.parse_jsonl_range("s.jsonl", 0, len(tail) + 17) == [[1, 2], ["a", "b"]]
+    assert reader.run_edit("s.jsonl", "d.jsonl", ["1,1,c"], {**mode, **QUIET})
+    assert read_jsonl("d.jsonl") == [[1, 2], ["a", "c"]]
+    assert not reader.run_edit("s.jsonl", "d.jsonl", ["1,2,c"], {**mode, **QUIET})
+
+
+@pytest.mark.parametrize("mode", [{}, {"stream": True}, {"workers": 2}])
+def test_jsonl_blank_line_in_the_middle_is_an_error(mode, capsys):
+    with open("s.jsonl", "wb") as jsonlfile:
+        jsonlfile.write(b'[1, 2]\n\n["a", "b"]\n')
+    assert not reader.run_edit("s.jsonl", "d.jsonl", ["1,1,c"], {**mode, **QUIET})
+    assert "Error decoding JSON." in capsys.readouterr().out
+
+
+@pytest.mark.parametrize("source, destination", [
+    ("s.csv", "d.jsonl"), ("s.jsonl", "d.csv"), ("s.csv", "d.json"), ("s.json", "d.pickle"),
+    ("s.pickle", "d.jsonl.gz"), ("s.csv.bz2", "d.csv"),
+])
+@pytest.mark.parametrize("prefetch", [False, True])
+def test_streaming_across_formats(source, destination, prefetch):
+    rows = [[cell for cell in row] for row in AWKWARD_ROWS[:300]]
+    write_rows(source, rows)
+    changes = ["1,3,X", "2,10:20,Y"]
+    assert reader.run_edit(source, "memory." + destination, changes, QUIET)
+    assert reader.run_edit(source, destination, changes, {"stream": True, "prefetch": prefetch, **QUIET})
+    assert read_rows(destination) == read_rows("memory." + destination)
+    assert read_rows(destination)[3][1] == "X"
+
+
+def test_prefetch_raises_on_the_writing_side():
+    write_rows("s.csv", AWKWARD_ROWS)
+    assert not reader.run_edit("s.csv", "d.csv", ["1,2400,X", "5,2450,Y"], {"stream": True, "prefetch": True, **QUIET})
+    assert not os.path.exists("d.csv") and not os.path.exists("d.csv.tmp")
+
+
+def test_streaming_rows_that_are_not_lists_is_an_error(capsys):
+    with open("s.jsonl", "w") as jsonlfile:
+        jsonlfile.write('{"a": 1}\n{"a": 2}\n')
+    assert not reader.run_edit("s.jsonl", "d.jsonl", ["0,1,X"], {"stream": True, **QUIET})
+    assert "Invalid change, please retry!" in capsys.readouterr().out
+    assert not os.path.exists("d.jsonl.tmp")
+
+
+def test_streaming_write_error_leaves_no_temporary_file(capsys):
+    write_rows("s.csv", [["a", "b"], ["1", "2"]])
+    os.mkdir("d.csv")
+    assert not reader.run_edit("s.csv", "d.csv", ["0,1,X"], {"stream": True, **QUIET})
+    assert "Error writing to file: d.csv" in capsys.readouterr().out
+    assert not os.path.exists("d.csv.tmp")
+
+
+@pytest.mark.parametrize("mode", [[], ["--stream"], ["--index"], ["--lazy"], ["--in-place"]])
+@pytest.mark.parametrize("destination", ["d.csv", "d.json", "d.jsonl", "d.pickle"])
+def test_quiet_prints_nothing_on_success(mode, destination):
+    write_rows("s.csv", [["a", "b"], ["1", "2"]])
+    if mode == ["--in-place"]:
+        destination = "s.csv"
+    result = run_reader("--quiet", *mode, "s.csv", destination, "0,1,X")
+    assert result.returncode == 0 and result.stdout == ""
+
+
+def shown(preview, capsys):
+    preview.show()
+    return capsys.readouterr().out.splitlines()
+
+
+@pytest.mark.parametrize("feed", ["table", "stream"])
+def test_preview_marks_the_gaps(feed, capsys):
+    rows = [[i, f"r{i}"] for i in range(20)]
+    preview = reader.Preview(head=2, tail=3, sample=2)
+    if feed == "table":
+        preview.add_table(rows)
+    else:
+        for row in rows:
+            preview.add(row)
+    lines = shown(preview, capsys)
+    assert lines[-1] == "(20 rows, showing 7; use --full to print every row)"
+
+    numbers, next_number = [], 0
+    for line in lines[:-1]:
+        if line.strip().startswith("..."):
+            next_number += int(line.split()[1])  # "... N rows ..." stands for the skipped rows
+        else:
+            number, cells = line.split()
+            assert int(number) == next_number and cells == f"{next_number},r{next_number}"
+            numbers.append(next_number)
+            next_number += 1
+    assert next_number == 20
+    assert numbers[:2] == [0, 1] and numbers[-3:] == [17, 18, 19]
+    assert len(numbers) == 7 and all(2 <= number < 17 for number in numbers[2:4])
+
+
+def test_preview_of_a_short_table_prints_every_row(capsys):
+    preview = reader.Preview(head=2, tail=2, sample=2)
+    preview.add_table([[i, "x"] for i in range(6)])
+    assert shown(preview, capsys) == [f"{i},x" for i in range(6)]
+
+
+JSON_ROWS = AWKWARD_ROWS[:5] + [[], [1, 2.5, None, True], [[1, [2, []]], {"k": [3, {}]}], {"a": "ünï\n"}, "text", 7]
+
+
+@pytest.mark.parametrize("rows", [JSON_ROWS, [], [[]], AWKWARD_ROWS * 3])
+def test_json_rows_match_json_dump(rows):
+    file = io.StringIO()
+    reader.write_json_rows(file, iter(rows))
+    assert file.getvalue() == json.dumps(rows, indent=4)
+
+
+@pytest.mark.parametrize("rows", [JSON_ROWS, [], AWKWARD_ROWS * 3])
+def test_compact_json_puts_a_row_per_line(rows):
+    file = io.StringIO()
+    reader.write_json_rows(file, rows, compact=True)
+    expected = "[\n" + ",\n".join(map(json.dumps, rows)) + "\n]" if rows else "[]"
+    assert file.getvalue() == expected
+    assert json.loads(file.getvalue()) == rows
+
+
+def test_json_rows_from_a_table():
+    table = reader.Table.build([["a", 1, 2.5, True], ["b", 2, 3.0, False]])
+    file = io.StringIO()
+    reader.write_json_rows(file, table)
+    assert file.getvalue() == json.dumps([["a", 1, 2.5, True], ["b", 2, 3.0, False]], indent=4)
+
+
+@pytest.mark.parametrize("compression", ["gzip", "bz2", "lzma"])
+def test_parallel_compressed_writer_round_trip(compression):
+    pieces = [os.urandom(size % 700) + b"text " * (size % 90) for size in range(400)]
+    writer = reader.ParallelCompressedWriter(open("d.bin", "wb"), reader.COMPRESSORS[compression],
+                                             block_size=1000, threads=2)
+    for piece in pieces:
+        assert writer.write(piece) == len(piece)
+    assert writer.tell() == sum(map(len, pieces))
+    writer.close()
+    with reader.open_file("d.bin", "rb", compression) as file:
+        assert file.read() == b"".join(pieces)
+
+
+@pytest.mark.parametrize("compression", ["gzip", "bz2", "lzma"])
+def test_parallel_compressed_writer_empty_stream(compression):
+    reader.ParallelCompressedWriter(open("d.bin", "wb"), reader.COMPRESSORS[compression]).close()
+    with reader.open_file("d.bin", "rb", compression) as file:
+        assert file.read() == b""
+
+
+@pytest.mark.parametrize("suffix", [".gz", ".bz2", ".xz"])
+@pytest.mark.parametrize("mode", [{}, {"stream": True}])
+def test_compressed_edit_round_trip(suffix, mode):
+    write_rows("s.csv" + suffix, AWKWARD_ROWS)
+    assert reader.compression_of("s.csv" + suffix, sniff=True) == reader.compression_of("x" + suffix)
+    assert reader.run_edit("s.csv" + suffix, "d.jsonl" + suffix, ["1,3,X"], {**mode, **QUIET})
+    assert read_rows("d.jsonl" + suffix) == AWKWARD_ROWS[:3] + [["2", "X", AWKWARD_ROWS[3][2]]] + AWKWARD_ROWS[4:]
+
+
+def write_directory():
+    os.makedirs("in/sub")
+    write_rows("in/a.csv", [["a", "b"], ["1", "2"]])
+    write_rows("in/b.jsonl", [["a", "b"], ["3", "4"]])
+    write_rows("in/c.csv.gz", [["a", "b"], ["5", "6"], ["7", "8"]])
+    for sidecar in ("in/a.csv.idx", "in/a.csv.tmp"):
+        open(sidecar, "w").close()
+
+
+def test_find_sources():
+    write_directory()
+    assert reader.find_sources("in") == ["in/a.csv", "in/b.jsonl", "in/c.csv.gz"]
+    assert reader.find_sources("in/*.csv*") == ["in/a.csv", "in/c.csv.gz"]
+    assert reader.find_sources("in/*.pickle") == []
+    with pytest.raises(FileNotFoundError):
+        reader.find_sources("missing/*.csv")
+
+
+@pytest.mark.parametrize("template, source, destination", [
+    ("out", "in/a.csv.gz", "out/a.csv.gz"),
+    ("{dir}/{stem}.edited{ext}", "in/a.csv.gz", "in/a.edited.csv.gz"),
+    ("out/{stem}.jsonl", "a.csv", "out/a.jsonl"),
+    ("{dir}/{name}.bak", "a.tar.csv", "./a.tar.csv.bak"),
+])
+def test_destination_for(template, source, destination):
+    assert reader.destination_for(template, source) == destination
+
+
+def test_cli_dir_applies_the_changes_to_every_file():
+    write_directory()
+    result = run_reader("--dir=in/*.csv*", "--workers=2", "out", "0,1,X")
+    assert result.returncode == 0
+    assert result.stdout.startswith("[1/2] ok in/a.csv -> out/a.csv")
+    assert read_rows("out/a.csv") == [["a", "b"], ["X", "2"]]
+    assert read_rows("out/c.csv.gz") == [["a", "b"], ["X", "6"], ["7", "8"]]
+    assert read_rows("in/a.csv") == [["a", "b"], ["1", "2"]]
+    assert sorted(os.listdir("out")) == ["a.csv", "c.csv.gz"]
+
+
+@pytest.mark.parametrize("arguments, message", [
+    (["--dir=in", "out", "0,2,X"], "[1/3] FAILED in/a.csv -> out/a.csv"),
+    (["--dir=in", "out/{dir}.csv", "0,1,X"], "Destination template maps several files to one: out/{dir}.csv"),
+    (["--dir=in", "out/{nope}", "0,1,X"], "Invalid destination template: out/{nope}"),
+    (["--dir=in/*.pickle", "out", "0,1,X"], "No files match: in/*.pickle"),
+    (["--dir=missing/*.csv", "out", "0,1,X"], "Directory not found: missing/*.csv"),
+])
+def test_cli_dir_failures(arguments, message):
+    write_directory()
+    result = run_reader(*arguments)
+    assert result.returncode == 1 and message in result.stdout